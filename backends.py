@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from resilience import (CircuitBreaker, CircuitOpenError, EventLog, ModelUnavailableError,
+                        TimeoutPolicy, retry)
+
+DEFAULT_HOST = "http://localhost:11434"
+CONFIG_FILE = "backends.json"
+
+
+class Backend:
+    """A single Ollama host and what we last learned about it"""
+
+    def __init__(self, url, breaker=None, cores=None):
+        self.url = url.rstrip("/")
+        self.breaker = breaker or CircuitBreaker()
+        self.cores = cores  # CPU cores on the host, if configured; used when tuning threads
+        self.healthy = True
+        self.models = None  # Installed model names; None until the first check
+        self.loaded_models = set()
+        self.in_flight = 0
+        self.last_error = None
+        self.last_check = 0.0
+
+    def __repr__(self):
+        state = "up" if self.healthy else "down"
+        return f"<Backend {self.url} {state} in_flight={self.in_flight}>"
+
+
+class BackendPool:
+    """Pool of Ollama hosts with background health checks and least-loaded routing"""
+
+    def __init__(self, urls=None, health_interval=10.0, timeout=3.0, policy=None,
+                 failure_threshold=3, reset_timeout=15.0, cores=None):
+        cores = {url.rstrip("/"): n for url, n in (cores or {}).items()}
+        self.backends = [
+            Backend(url, CircuitBreaker(failure_threshold, reset_timeout), cores.get(url.rstrip("/")))
+            for url in (urls or [DEFAULT_HOST])
+        ]
+        self.health_interval = health_interval
+        self.timeout = timeout
+        self.policy = policy or TimeoutPolicy()
+        self.events = EventLog()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, path=CONFIG_FILE):
+        """Build a pool from a JSON config file, falling back to localhost"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            config = json.load(f)
+        return cls(
+            urls=config.get("hosts") or [DEFAULT_HOST],
+            health_interval=config.get("health_interval", 10.0),
+            timeout=config.get("health_timeout", 3.0),
+            policy=TimeoutPolicy.from_config(config),
+            failure_threshold=config.get("breaker_failures", 3),
+            reset_timeout=config.get("breaker_reset", 15.0),
+            cores=config.get("cores")
+        )
+
+    def start(self):
+        """Start the background health-check thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.health_interval)
+
+    def check_all(self):
+        for backend in self.backends:
+            self.check(backend)
+
+    def check(self, backend):
+        """Refresh a host's installed and loaded models; mark it down on failure"""
+        try:
+            response = retry(
+                lambda: requests.get(f"{backend.url}/api/tags", timeout=self.timeout),
+                events=self.events,
+                host=backend.url
+            )
+            response.raise_for_status()
+            models = {m['name'] for m in response.json().get('models', [])}
+            loaded = set()
+            try:
+                ps = requests.get(f"{backend.url}/api/ps", timeout=self.timeout)
+                if ps.ok:
+                    loaded = {m['name'] for m in ps.json().get('models', [])}
+            except requests.RequestException:
+                pass  # Older servers have no /api/ps
+            with self.lock:
+                backend.models = models
+                backend.loaded_models = loaded
+                backend.healthy = True
+                backend.last_error = None
+        except Exception as e:
+            with self.lock:
+                backend.healthy = False
+                backend.last_error = str(e)
+        backend.last_check = time.monotonic()
+        return backend.healthy
+
+    def find(self, url):
+        """The backend for a host URL, or None"""
+        return next((b for b in self.backends if b.url == url.rstrip("/")), None)
+
+    def list_models(self):
+        """Merged, sorted model names across all healthy hosts"""
+        with self.lock:
+            names = set()
+            for backend in self.backends:
+                if backend.healthy and backend.models:
+                    names |= backend.models
+        return sorted(names)
+
+    def has_model(self, model):
+        """Whether any host, up or down, has or may have the model installed"""
+        with self.lock:
+            return any(b.models is None or model in b.models for b in self.backends)
+
+    def acquire(self, model, exclude=(), prefer=None):
+        """Pick the least-loaded healthy host for a model and count the request against it.
+
+        A host that has not been checked yet is assumed to serve any model.
+        A usable `prefer` host (e.g. one whose cache was just warmed) always
+        wins; otherwise hosts that already have the model loaded win over
+        ones that would have to load it. Returns None when no host is usable.
+        """
+        exclude = list(exclude)
+        with self.lock:
+            while True:
+                candidates = [
+                    b for b in self.backends
+                    if b.healthy and b not in exclude and b.breaker.available()
+                    and (b.models is None or model in b.models)
+                ]
+                if not candidates:
+                    return None
+                backend = min(
+                    candidates,
+                    key=lambda b: (b.url != prefer, model not in b.loaded_models, b.in_flight)
+                )
+                # Another thread may have taken the half-open probe slot
+                if backend.breaker.allow():
+                    backend.in_flight += 1
+                    return backend
+                exclude.append(backend)
+
+    def release(self, backend):
+        with self.lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+
+    def mark_down(self, backend, error=None):
+        with self.lock:
+            backend.healthy = False
+            backend.last_error = str(error) if error else None
+
+    def request(self, model, send, prefer=None):
+        """Run send(base_url) on the best host, failing over to the next one if a host dies.
+
+        Only connection-level failures and timeouts trigger failover; HTTP
+        errors from a live server are returned to the caller unchanged.
+        Hosts with an open circuit breaker are skipped without being contacted.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self.acquire(model, exclude=tried, prefer=prefer)
+            if backend is None:
+                if last_error is None:
+                    if not self.has_model(model):
+                        self.events.record("no_host_for_model", detail=model)
+                        raise ModelUnavailableError(f"No Ollama host has {model} installed")
+                    self.events.record("shed", detail=model)
+                    raise CircuitOpenError(f"No healthy Ollama host available for {model}")
+                raise last_error
+            try:
+                result = send(backend.url)
+                backend.breaker.record_success()
+                return result
+            except requests.Timeout as e:
+                # StreamTimeout was already recorded by the stream watchdog
+                if isinstance(e, requests.ConnectTimeout):
+                    self.events.record("connect_timeout", host=backend.url)
+                elif isinstance(e, requests.ReadTimeout):
+                    self.events.record("read_timeout", host=backend.url)
+                self._record_failure(backend)
+                tried.append(backend)
+                last_error = e
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if e.args and isinstance(e.args[0], ReadTimeoutError):
+                    # requests reports a read timeout in the body as a ConnectionError;
+                    # the host is slow, not gone
+                    self.events.record("read_timeout", host=backend.url)
+                    self._record_failure(backend)
+                    tried.append(backend)
+                    last_error = e
+                    continue
+                self.events.record("connection_error", host=backend.url, detail=str(e))
+                self.mark_down(backend, e)
+                self._record_failure(backend)
+                tried.append(backend)
+                last_error = e
+            except Exception:
+                backend.breaker.record_success()  # The host answered; the request was bad
+                raise
+            finally:
+                self.release(backend)
+
+    def _record_failure(self, backend):
+        if backend.breaker.record_failure():
+            self.events.record("breaker_open", host=backend.url)
@@ -0,0 +1,142 @@
+import itertools
+
+
+class Node:
+    """One message in a conversation tree; branches share every ancestor node"""
+
+    __slots__ = ("id", "parent", "message", "children", "active_child")
+
+    def __init__(self, node_id, parent, message):
+        self.id = node_id
+        self.parent = parent
+        self.message = message
+        self.children = []
+        self.active_child = None  # Child followed when walking down to the branch leaf
+
+    def __repr__(self):
+        sender = self.message.get("sender") if self.message else "root"
+        return f"<Node {self.id} {sender} children={len(self.children)}>"
+
+
+class ConversationTree:
+    """Conversation stored as a tree so edits and regenerations become sibling branches"""
+
+    def __init__(self):
+        self._ids = itertools.count()
+        self.root = Node(next(self._ids), None, None)
+        self.nodes = {self.root.id: self.root}
+        self.current = self.root
+
+    def _new_node(self, parent, message, node_id=None):
+        if node_id is None:
+            node_id = next(self._ids)
+        node = Node(node_id, parent, message)
+        parent.children.append(node)
+        parent.active_child = node
+        self.nodes[node.id] = node
+        return node
+
+    def append(self, message, parent=None):
+        """Add a message below parent (default: the current leaf) and make it current"""
+        parent = parent if parent is not None else self.current
+        self.current = self._new_node(parent, message)
+        return self.current
+
+    def remove(self, node):
+        """Delete a leaf, e.g. a prompt whose reply failed; its parent becomes current if it was"""
+        if node.children or node is self.root:
+            raise ValueError("Only leaf messages can be removed")
+        parent = node.parent
+        parent.children.remove(node)
+        if parent.active_child is node:
+            parent.active_child = parent.children[-1] if parent.children else None
+        del self.nodes[node.id]
+        if self.current is node:
+            self.current = parent
+
+    def fork(self, node):
+        """Make node's parent current so the next append starts a sibling branch"""
+        self.current = node.parent
+        return self.current
+
+    def path(self, node=None):
+        """Nodes from the first message down to node (default: current), root excluded"""
+        node = node if node is not None else self.current
+        nodes = []
+        while node is not None and node is not self.root:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def messages(self, node=None):
+        return [n.message for n in self.path(node)]
+
+    def leaf(self, node):
+        """Follow the active child pointers from node down to the end of its branch"""
+        while node.active_child is not None:
+            node = node.active_child
+        return node
+
+    def siblings(self, node):
+        return node.parent.children if node.parent is not None else [node]
+
+    def switch(self, node, step):
+        """Move to the sibling branch step positions away and return the new current leaf"""
+        siblings = self.siblings(node)
+        index = (siblings.index(node) + step) % len(siblings)
+        target = siblings[index]
+        target.parent.active_child = target
+        self.current = self.leaf(target)
+        return self.current
+
+    def branch_label(self, node):
+        """e.g. "2/3" for the second of three alternatives; empty if there is no fork"""
+        siblings = self.siblings(node)
+        if len(siblings) < 2:
+            return ""
+        return f"{siblings.index(node) + 1}/{len(siblings)}"
+
+    @staticmethod
+    def common_prefix(a, b):
+        """Number of leading nodes two paths share"""
+        count = 0
+        for x, y in zip(a, b):
+            if x is not y:
+                break
+            count += 1
+        return count
+
+    def to_dict(self):
+        nodes = []
+        for node in self.nodes.values():
+            if node is self.root:
+                continue
+            nodes.append({
+                "id": node.id,
+                "parent": node.parent.id,
+                "message": node.message,
+                "active": node.parent.active_child is node
+            })
+        return {"version": 2, "current": self.current.id, "nodes": nodes}
+
+    @classmethod
+    def from_data(cls, data):
+        """Load a saved tree, or a flat message list from the old history format"""
+        tree = cls()
+        if isinstance(data, list):
+            for message in data:
+                tree.append(message)
+            return tree
+        # Parents are always saved before their children
+        active = {}
+        for entry in data.get("nodes", []):
+            parent = tree.nodes[entry["parent"]]
+            node = tree._new_node(parent, entry["message"], node_id=entry["id"])
+            if entry.get("active"):
+                active[parent.id] = node
+        for node in tree.nodes.values():
+            node.active_child = active.get(node.id, node.children[-1] if node.children else None)
+        tree._ids = itertools.count(max(tree.nodes) + 1)
+        tree.current = tree.nodes.get(data.get("current"), tree.root)
+        return tree
@@ -0,0 +1,251 @@
+import json
+import os
+import time
+from base64 import b64encode
+from datetime import datetime
+
+import requests
+
+from backends import BackendPool
+from conversation import ConversationTree
+from jsonstream import IncrementalJSONParser, SchemaWatcher
+from postprocess import ANSWER, ResponsePostProcessor
+from resilience import iter_stream_lines
+from tracing import Tracer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+HISTORY_DIR = "history"
+
+
+class ChatEngine:
+    """Everything that talks to Ollama or shapes messages, with no UI attached.
+
+    ChatGUI drives one engine from Tk; the server drives one engine for many
+    sessions. The engine is thread-safe as long as each conversation tree is
+    only mutated by one caller at a time.
+    """
+
+    def __init__(self, pool=None, tracer=None):
+        self.pool = pool or BackendPool.from_config()
+        self.tracer = tracer or Tracer()
+
+    def refresh_models(self):
+        """Health-check every host and return the merged model list"""
+        self.pool.check_all()
+        self.pool.start()
+        if not any(b.healthy for b in self.pool.backends):
+            raise ConnectionError(self.pool.backends[0].last_error)
+        return self.pool.list_models()
+
+    def build_user_message(self, text, file_paths=()):
+        """Create a user message referencing its attachments by path.
+
+        Images are only read and embedded by encode_attachments(), which is
+        slow for large files and so belongs off the UI thread.
+        """
+        message = {
+            "text": text,
+            "attachments": [],
+            "sender": "You",
+            "timestamp": datetime.now().isoformat()
+        }
+        for file_path in file_paths:
+            message["attachments"].append({
+                "type": "image" if file_path.lower().endswith(IMAGE_EXTENSIONS) else "document",
+                "path": file_path,
+                "name": os.path.basename(file_path)
+            })
+        return message
+
+    def encode_attachments(self, attachments):
+        """Copy of attachments with images embedded as base64 instead of referenced by path"""
+        with self.tracer.span("encode_attachments", attachments=len(attachments)):
+            return self._encode_attachments(attachments)
+
+    def _encode_attachments(self, attachments):
+        encoded = []
+        for att in attachments:
+            if att["type"] == "image" and "data" not in att:
+                with open(att["path"], "rb") as f:
+                    data = b64encode(f.read()).decode('utf-8')
+                att = {"type": "image", "data": data, "name": att["name"]}
+            encoded.append(att)
+        return encoded
+
+    def build_chat_payload(self, model, conversation, user_node, options=None):
+        """/api/chat request for the branch ending at user_node"""
+        payload = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user" if m.get("sender") == "You" else "assistant",
+                    "content": m.get("text", m.get("message", ""))
+                }
+                for m in conversation.messages(user_node)
+            ],
+            "stream": True
+        }
+        if options:
+            payload["options"] = options
+        return payload
+
+    def stream_reply(self, model, conversation, user_node, on_piece=None, options=None, prefer=None):
+        """Stream a reply to user_node and return (answer, reasoning).
+
+        on_piece(channel, text) is called from this thread for every cleaned
+        piece as it arrives. If the pool fails over to another host the reply
+        restarts, signalled by on_piece("restart", ""). options are Ollama
+        generation options such as num_ctx or num_thread. prefer names a host
+        to use if it is healthy, e.g. one holding a warmed prompt cache.
+        """
+        answer, reasoning, _ = self._stream(
+            model, conversation, user_node, on_piece, options=options, prefer=prefer
+        )
+        return answer, reasoning
+
+    def stream_structured(self, model, conversation, user_node, schema="json",
+                          on_event=None, on_piece=None, options=None, prefer=None):
+        """Stream a JSON-mode reply and return (value, answer_text, reasoning).
+
+        schema is passed as Ollama's `format`: either "json" or a JSON schema.
+        on_event(kind, path, value) fires for each member or array item as it
+        closes. Generation is cut off as soon as every field the schema
+        requires has arrived, or when the top-level value closes.
+        """
+        answer, reasoning, value = self._stream(
+            model, conversation, user_node, on_piece, schema, on_event, options, prefer
+        )
+        return value, answer, reasoning
+
+    def _stream(self, model, conversation, user_node, on_piece=None, schema=None, on_event=None,
+                options=None, prefer=None):
+        payload = self.build_chat_payload(model, conversation, user_node, options)
+        if schema is not None:
+            payload["format"] = schema
+        return self._stream_payload(model, payload, on_piece, schema, on_event, prefer)
+
+    def _stream_payload(self, model, payload, on_piece=None, schema=None, on_event=None, prefer=None):
+        """Run one /api/chat stream; returns (answer, reasoning, structured value or None)"""
+        attempts = []
+
+        def send(base_url):
+            if attempts and on_piece:
+                on_piece("restart", "")
+            attempts.append(base_url)
+            processor = ResponsePostProcessor()
+            parser = IncrementalJSONParser() if schema is not None else None
+            watcher = SchemaWatcher(schema)
+            # Time spent in each stage, summed over chunks and reported as span args;
+            # postprocess includes the on_piece/on_event callbacks
+            stages = {"ndjson_ns": 0, "postprocess_ns": 0, "json_ns": 0}
+            chunks = 0
+            final = {}
+            started = time.perf_counter_ns()
+            first_line = None
+            with requests.post(
+                f"{base_url}/api/chat",
+                json=payload,
+                stream=True,
+                timeout=self.pool.policy.requests_timeout()
+            ) as response:
+                response.raise_for_status()
+                for line in iter_stream_lines(response, self.pool.policy, self.pool.events, base_url):
+                    t0 = time.perf_counter_ns()
+                    if first_line is None:
+                        first_line = t0
+                        self.tracer.record("wait for first chunk", started, t0, host=base_url,
+                                           attempt=len(attempts))
+                    chunk = json.loads(line)
+                    t1 = time.perf_counter_ns()
+                    chunks += 1
+                    stages["ndjson_ns"] += t1 - t0
+                    if chunk.get("done"):
+                        final = chunk
+                    if not chunk.get("message"):
+                        continue
+                    satisfied = False
+                    for channel, text in processor.feed(chunk["message"]["content"]):
+                        if on_piece:
+                            on_piece(channel, text)
+                        if parser is not None and channel == ANSWER:
+                            t2 = time.perf_counter_ns()
+                            events = parser.feed(text)
+                            if on_event:
+                                for event in events:
+                                    on_event(*event)
+                            satisfied = watcher.update(events) or satisfied
+                            stages["json_ns"] += time.perf_counter_ns() - t2
+                    stages["postprocess_ns"] += time.perf_counter_ns() - t1
+                    if satisfied:
+                        # Closing the stream makes Ollama stop generating
+                        break
+            ended = time.perf_counter_ns()
+            if first_line is not None:
+                self.tracer.record("stream", first_line, ended, host=base_url, chunks=chunks,
+                                   **{k[:-3] + "_ms": v / 1e6 for k, v in stages.items()})
+            self._trace_server_timings(final, ended)
+            answer, reasoning = processor.finish()
+            if parser is None:
+                return answer, reasoning, None
+            parser.finish()
+            return answer, reasoning, parser.partial()
+
+        return self.pool.request(model, send, prefer=prefer)
+
+    def _trace_server_timings(self, final, ended):
+        """Lay Ollama's own load/prefill/decode durations out on a track ending at `ended`"""
+        end = ended
+        for name, key, count in (("decode", "eval_duration", "eval_count"),
+                                 ("prefill", "prompt_eval_duration", "prompt_eval_count"),
+                                 ("model load", "load_duration", None)):
+            duration = final.get(key)
+            if duration:
+                self.tracer.record(name, end - duration, end, track="ollama server",
+                                   tokens=final.get(count) if count else None)
+                end -= duration
+
+    def add_reply(self, conversation, user_node, answer, reasoning="", structured=None):
+        """Record a finished reply as a child of user_node"""
+        message = {
+            "sender": "Assistant",
+            "text": answer,
+            "timestamp": datetime.now().isoformat()
+        }
+        if reasoning:
+            message["reasoning"] = reasoning
+        if structured is not None:
+            # Early-stopped replies have no closing braces, so store the parsed value
+            message["text"] = json.dumps(structured, indent=2)
+            message["structured"] = structured
+        return conversation.append(message, parent=user_node)
+
+    def generate(self, model, prompt, options=None):
+        """Single non-streaming /api/generate call with no conversation history"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }
+        if options:
+            payload["options"] = options
+
+        def send(base_url):
+            response = requests.post(
+                f"{base_url}/api/generate",
+                json=payload,
+                timeout=self.pool.policy.requests_timeout()
+            )
+            response.raise_for_status()
+            return json.loads(response.text)
+
+        return self.pool.request(model, send).get("response", "")
+
+    def save_conversation(self, conversation, name="chat_history.json"):
+        if not os.path.exists(HISTORY_DIR):
+            os.makedirs(HISTORY_DIR)
+        with open(os.path.join(HISTORY_DIR, name), "w") as f:
+            json.dump(conversation.to_dict(), f, indent=4)
+
+    def load_conversation(self, name="chat_history.json"):
+        with open(os.path.join(HISTORY_DIR, name), "r") as f:
+            return ConversationTree.from_data(json.load(f))
@@ -0,0 +1,190 @@
+import json
+
+WHITESPACE = " \t\r\n"
+
+FIELD = "field"  # An object member finished: (FIELD, path, value)
+ITEM = "item"  # An array element finished: (ITEM, path, value)
+DONE = "done"  # The top-level value finished: (DONE, (), value)
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+# What a container accepts next
+KEY = "key"
+KEY_OR_CLOSE = "key or close"
+COLON = "colon"
+VALUE = "value"
+VALUE_OR_CLOSE = "value or close"
+COMMA_OR_CLOSE = "comma or close"
+
+
+class _Container:
+    __slots__ = ("path", "value", "key", "expect")
+
+    def __init__(self, path, value):
+        self.path = path
+        self.value = value
+        self.key = None
+        self.expect = KEY_OR_CLOSE if isinstance(value, dict) else VALUE_OR_CLOSE
+
+
+class IncrementalJSONParser:
+    """Push parser that reports JSON members and array items as soon as they close.
+
+    Feed it text in arbitrary chunks; each call returns the events completed
+    by that chunk. Every character is handled once, so parsing the whole
+    stream is linear in its length. Strings and numbers are decoded with the
+    json module so escapes and number formats match json.loads exactly.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.token = None  # Characters of the string or scalar being read
+        self.in_string = False
+        self.escape = False
+        self.string_is_key = False
+        self.done = False
+        self.result = None
+
+    def feed(self, text):
+        events = []
+        for c in text:
+            if self.done:
+                if c not in WHITESPACE:
+                    raise JSONStreamError(f"Unexpected {c!r} after the JSON value")
+                continue
+            if self.in_string:
+                self._string_char(c, events)
+            elif self.token is not None:
+                if c in WHITESPACE or c in ",]}":
+                    self._finish_scalar(events)
+                    self._structural(c, events)
+                else:
+                    self.token.append(c)
+            else:
+                self._structural(c, events)
+        return events
+
+    def finish(self):
+        """End of input: flush a pending top-level scalar"""
+        events = []
+        if self.token is not None and not self.in_string and not self.stack:
+            self._finish_scalar(events)
+        return events
+
+    def partial(self):
+        """The value built so far, including members of still-open containers"""
+        if self.done:
+            return self.result
+        return self.stack[0].value if self.stack else None
+
+    def _string_char(self, c, events):
+        if self.escape:
+            self.escape = False
+            self.token.append(c)
+        elif c == "\\":
+            self.escape = True
+            self.token.append(c)
+        elif c == '"':
+            value = json.loads('"' + "".join(self.token) + '"', strict=False)
+            self.token = None
+            self.in_string = False
+            if self.string_is_key:
+                self.stack[-1].key = value
+                self.stack[-1].expect = COLON
+            else:
+                self._complete(value, events)
+        else:
+            self.token.append(c)
+
+    def _finish_scalar(self, events):
+        raw = "".join(self.token)
+        self.token = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            raise JSONStreamError(f"Invalid literal {raw!r}")
+        self._complete(value, events)
+
+    def _structural(self, c, events):
+        if c in WHITESPACE:
+            return
+        top = self.stack[-1] if self.stack else None
+        expect = top.expect if top is not None else VALUE
+        if c == '"':
+            if expect in (KEY, KEY_OR_CLOSE):
+                self.string_is_key = True
+            elif expect in (VALUE, VALUE_OR_CLOSE):
+                self.string_is_key = False
+            else:
+                raise JSONStreamError(f"Expected {expect}, got a string")
+            self.in_string = True
+            self.token = []
+        elif c in "{[":
+            if expect not in (VALUE, VALUE_OR_CLOSE):
+                raise JSONStreamError(f"Expected {expect}, got {c!r}")
+            value = {} if c == "{" else []
+            self.stack.append(_Container(self._child_path(top), value))
+        elif c in "}]":
+            closes = KEY_OR_CLOSE if c == "}" else VALUE_OR_CLOSE
+            if (top is None or isinstance(top.value, dict) != (c == "}")
+                    or expect not in (COMMA_OR_CLOSE, closes)):
+                raise JSONStreamError(f"Unexpected {c!r}")
+            self.stack.pop()
+            self._complete(top.value, events)
+        elif c == ":":
+            if expect != COLON:
+                raise JSONStreamError("Unexpected ':'")
+            top.expect = VALUE
+        elif c == ",":
+            if expect != COMMA_OR_CLOSE:
+                raise JSONStreamError("Unexpected ','")
+            top.expect = KEY if isinstance(top.value, dict) else VALUE
+        elif expect in (VALUE, VALUE_OR_CLOSE):
+            self.token = [c]
+        else:
+            raise JSONStreamError(f"Expected {expect}, got {c!r}")
+
+    def _child_path(self, top):
+        if top is None:
+            return ()
+        if isinstance(top.value, dict):
+            return top.path + (top.key,)
+        return top.path + (len(top.value),)
+
+    def _complete(self, value, events):
+        if not self.stack:
+            self.done = True
+            self.result = value
+            events.append((DONE, (), value))
+            return
+        top = self.stack[-1]
+        path = self._child_path(top)
+        top.expect = COMMA_OR_CLOSE
+        if isinstance(top.value, dict):
+            top.value[top.key] = value
+            top.key = None
+            events.append((FIELD, path, value))
+        else:
+            top.value.append(value)
+            events.append((ITEM, path, value))
+
+
+class SchemaWatcher:
+    """Tracks when a streamed object already holds every field its schema requires"""
+
+    def __init__(self, schema=None):
+        schema = schema if isinstance(schema, dict) else {}
+        self.required = set(schema.get("required") or ())
+        self.seen = set()
+
+    def update(self, events):
+        """Feed parser events; returns True once generation can stop"""
+        for kind, path, _ in events:
+            if kind == DONE:
+                return True
+            if kind == FIELD and len(path) == 1:
+                self.seen.add(path[0])
+        return bool(self.required) and self.required <= self.seen
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+
+async def http_request(host, port, method, path, user, body=None, on_line=None):
+    """Minimal HTTP/1.1 client; streamed NDJSON lines are passed to on_line as they arrive"""
+    reader, writer = await asyncio.open_connection(host, port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write((
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"X-User: {user}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+
+    lines = []
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            chunk = await reader.readexactly(size + 2)
+            for raw in chunk[:-2].splitlines():
+                obj = json.loads(raw)
+                lines.append(obj)
+                if on_line:
+                    on_line(obj)
+    else:
+        payload = await reader.read()
+        if payload:
+            lines.append(json.loads(payload))
+    writer.close()
+    return status, lines
+
+
+async def one_conversation(args, user, prompt, results):
+    status, body = await http_request(args.host, args.port, "POST", "/api/sessions", user,
+                                      {"model": args.model})
+    if status != 201:
+        results["errors"].append(status)
+        return
+    session_id = body[0]["session_id"]
+
+    for _ in range(args.turns):
+        started = time.perf_counter()
+        first = []
+        pieces = [0]
+
+        def on_line(obj):
+            if "channel" in obj:
+                pieces[0] += 1
+                if not first:
+                    first.append(time.perf_counter() - started)
+
+        status, lines = await http_request(args.host, args.port, "POST",
+                                           f"/api/sessions/{session_id}/messages", user,
+                                           {"text": prompt}, on_line)
+        elapsed = time.perf_counter() - started
+        if status != 200 or not lines or lines[-1].get("error"):
+            results["errors"].append(status if status != 200 else lines[-1].get("error"))
+            continue
+        results["latency"].append(elapsed)
+        results["ttft"].append(first[0] if first else elapsed)
+        results["pieces"] += pieces[0]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    results = {"latency": [], "ttft": [], "pieces": 0, "errors": []}
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        one_conversation(args, f"user{i % args.users}", args.prompt, results)
+        for i in range(args.concurrency)
+    ])
+    wall = time.perf_counter() - started
+
+    done = len(results["latency"])
+    print(f"replies:      {done} ok, {len(results['errors'])} failed in {wall:.2f}s")
+    print(f"throughput:   {done / wall:.2f} replies/s, {results['pieces'] / wall:.1f} pieces/s")
+    if done:
+        print(f"ttft:         p50 {percentile(results['ttft'], 50) * 1000:.0f} ms, "
+              f"p95 {percentile(results['ttft'], 95) * 1000:.0f} ms")
+        print(f"latency:      p50 {percentile(results['latency'], 50) * 1000:.0f} ms, "
+              f"p95 {percentile(results['latency'], 95) * 1000:.0f} ms, "
+              f"mean {statistics.mean(results['latency']) * 1000:.0f} ms")
+    if results["errors"]:
+        print(f"errors:       {sorted(set(map(str, results['errors'])))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel conversations")
+    parser.add_argument("--users", type=int, default=16, help="Distinct X-User values")
+    parser.add_argument("--turns", type=int, default=3, help="Messages per conversation")
+    parser.add_argument("--prompt", default="Say hello in one short sentence.")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
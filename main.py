@@ -1,19 +1,80 @@
 import os
-import requests
-import json
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
+import time
 from PIL import Image, ImageTk, ImageDraw
 import sys
-from base64 import b64encode
 from datetime import datetime
 import io
 import base64
 from pygments import lex
 from pygments.lexers import get_lexer_by_name, TextLexer
 from pygments.token import Token
-import re
+import itertools
+import uuid
+from conversation import ConversationTree
+from stall_monitor import StallMonitor
+from worker import ProcessEngine
+from engine import ChatEngine
+from profiles import AUTO_PROFILE, DEFAULT_PROFILE, ProfileStore, autotune_on_pool
+from semcache import SemanticCache
+from speculative import PrefillSpeculator
+
+LIVE_INTERVAL_MS = 100  # How often the visible tab's streamed text is drawn
+WARMUP_DELAY_MS = 600  # Typing pause before the conversation is prefilled speculatively
+
+class ChatTab:
+    """One conversation in the tabbed workspace, with its own history widget and stream"""
+
+    def __init__(self, frame, chat_history, file_name):
+        self.frame = frame
+        self.chat_history = chat_history
+        self.file_name = file_name
+        self.conversation = ConversationTree()
+        self.rendered_path = []  # Nodes currently drawn in chat_history, in order
+        self.edit_target = None  # User node being edited; the next send branches from it
+        self.streaming = False
+        self.status = "Status: Ready"
+        self.pending_reply = None  # Finished reply waiting for the tab to be shown
+        
+        # Streamed answer text; the worker thread appends, the Tk thread draws
+        # it only while this tab is visible
+        self.lock = threading.Lock()
+        self.live_parts = []
+        self.live_drawn = 0
+        self.live_reset = False
+        self.live_shown = False  # Typing indicator is currently in chat_history
+        
+        # Trace of the reply being streamed, and of each finished reply by node id
+        self.trace = None
+        self.traces = {}
+
+    def add_piece(self, channel, text):
+        """Buffer a streamed piece (worker thread); never touches widgets"""
+        with self.lock:
+            if channel == "answer":
+                self.live_parts.append(text)
+            elif channel in ("restart", "reclassify"):
+                self.live_parts = []
+                self.live_reset = True
+
+    def take_new_text(self):
+        """Text streamed since the last draw, and whether the drawn text must be cleared"""
+        with self.lock:
+            reset = self.live_reset
+            self.live_reset = False
+            if reset:
+                self.live_drawn = 0
+            text = "".join(self.live_parts[self.live_drawn:])
+            self.live_drawn = len(self.live_parts)
+            return reset, text
+
+    def reset_live(self):
+        with self.lock:
+            self.live_parts = []
+            self.live_drawn = 0
+            self.live_reset = False
 
 class ChatGUI:
     def __init__(self, root):
@@ -76,12 +137,46 @@ class ChatGUI:
             background=[('readonly', self.theme['bg_dark'])]
         )
         
-        self.context = None
+        style.configure(
+            "Custom.TNotebook",
+            background=self.theme['bg_light'],
+            foreground=self.theme['text_primary']
+        )
+        style.configure(
+            "Custom.TNotebook.Tab",
+            background=self.theme['bg_medium'],
+            foreground=self.theme['text_primary'],
+            padding=[10, 2],
+            lightcolor=self.theme['bg_medium'],
+            darkcolor=self.theme['bg_medium']
+        )
+        style.map(
+            "Custom.TNotebook.Tab",
+            background=[("selected", self.theme['bg_dark'])],
+            foreground=[("selected", self.theme['text_primary'])],
+            lightcolor=[("selected", self.theme['bg_dark'])],
+            darkcolor=[("selected", self.theme['bg_dark'])]
+        )
+        
         self.available_models = []
-        self.chat_history_data = []
+        self.tabs = {}
+        self.current_tab = None
+        self.typing_steps = [".  ", ".. ", "..."]
+        self.live_ticks = 0
+        self._reasoning_ids = itertools.count()
         self.attachments = []
         self.current_attachments = []
         
+        # Headless backend; Ollama hosts are configured from backends.json.
+        # CHAT_WORKER_PROCESS=1 moves streaming and encoding into a child process.
+        self.worker_mode = os.environ.get("CHAT_WORKER_PROCESS") == "1"
+        self.engine = ProcessEngine() if self.worker_mode else ChatEngine()
+        self.backend_pool = self.engine.pool
+        self.tracer = self.engine.tracer
+        self.speculator = PrefillSpeculator(self.engine)
+        self.semantic_cache = SemanticCache.from_env(self.engine)
+        self._warmup_after = None
+        
         # Load and resize icons
         self.user_icon = self._load_resized_icon("user.png")
         self.bot_icon = self._load_resized_icon("bot.png")
@@ -95,7 +190,7 @@ class ChatGUI:
         # Create Footer
         self.create_footer()
         
-        # Fetch models in background thread
+        # Fetch models in background thread, then keep hosts health-checked
         threading.Thread(target=self.fetch_available_models).start()
         
         # Configure fonts
@@ -106,15 +201,65 @@ class ChatGUI:
         else:
             self.emoji_font = ("Segoe UI Emoji", 12)
         
-        self.configure_code_highlighting()
+        # One timer draws streamed text for whichever tab is visible
+        self.root.after(LIVE_INTERVAL_MS, self._tick_live)
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Watch the Tk event loop for stalls (see logs/stalls.log)
+        self.stall_monitor = StallMonitor.from_env(
+            self.root, label="worker process" if self.worker_mode else "in-process"
+        )
+        if self.stall_monitor:
+            self.stall_monitor.start()
+        
+    @property
+    def chat_history_data(self):
+        """Messages on the currently selected branch"""
+        return self.conversation.messages()
+        
+    # The visible tab's state, so the single-conversation code paths keep working
+    @property
+    def chat_history(self):
+        return self.current_tab.chat_history
+        
+    @property
+    def conversation(self):
+        return self.current_tab.conversation
+        
+    @conversation.setter
+    def conversation(self, value):
+        self.current_tab.conversation = value
+        
+    @property
+    def rendered_path(self):
+        return self.current_tab.rendered_path
         
+    @rendered_path.setter
+    def rendered_path(self, value):
+        self.current_tab.rendered_path = value
+        
+    @property
+    def edit_target(self):
+        return self.current_tab.edit_target
+        
+    @edit_target.setter
+    def edit_target(self, value):
+        self.current_tab.edit_target = value
+        
+    @property
+    def streaming(self):
+        return self.current_tab.streaming
+        
+    def on_close(self):
+        # The cache index is only written periodically; keep the latest entries
+        self.semantic_cache.save()
+        self.root.destroy()
+
     def fetch_available_models(self):
-        """Fetch list of available models from Ollama"""
+        """Fetch list of available models merged across all Ollama hosts"""
         try:
-            response = requests.get("http://localhost:11434/api/tags")
-            response.raise_for_status()
-            models_data = json.loads(response.text)
-            self.available_models = [model['name'] for model in models_data.get('models', [])]
+            self.available_models = self.engine.refresh_models()
             
             # Update combobox on main thread
             self.root.after(0, lambda: self.model_selector.configure(
@@ -183,6 +328,14 @@ class ChatGUI:
             font=("Segoe UI", 16, "bold")
         )
         header_label.pack(side="left", padx=20, pady=10)
+        
+        new_tab_btn = ttk.Button(
+            header,
+            text="+ New chat",
+            command=self.new_tab,
+            style="Custom.TButton"
+        )
+        new_tab_btn.pack(side="left", pady=10)
 
         # Model Selector
         model_frame = tk.Frame(header, bg=self.theme['bg_light'])
@@ -206,13 +359,106 @@ class ChatGUI:
             style="Custom.TCombobox"
         )
         self.model_selector.pack(side="left")
+        
+        # Structured output: ask Ollama for JSON and parse it as it streams
+        self.json_mode_var = tk.BooleanVar(value=False)
+        json_toggle = tk.Checkbutton(
+            model_frame,
+            text="JSON",
+            variable=self.json_mode_var,
+            bg=self.theme['bg_light'],
+            fg=self.theme['text_primary'],
+            selectcolor=self.theme['bg_dark'],
+            activebackground=self.theme['bg_light'],
+            activeforeground=self.theme['text_primary'],
+            font=("Segoe UI", 10)
+        )
+        json_toggle.pack(side="left", padx=(10, 0))
+        
+        # Speculative prefill: warm the server's cache while the user types
+        self.prefill_var = tk.BooleanVar(value=False)
+        prefill_toggle = tk.Checkbutton(
+            model_frame,
+            text="Warm-up",
+            variable=self.prefill_var,
+            command=self.speculator.cancel,
+            bg=self.theme['bg_light'],
+            fg=self.theme['text_primary'],
+            selectcolor=self.theme['bg_dark'],
+            activebackground=self.theme['bg_light'],
+            activeforeground=self.theme['text_primary'],
+            font=("Segoe UI", 10)
+        )
+        prefill_toggle.pack(side="left", padx=(5, 0))
+        
+        # Semantic cache: answer near-repeats of earlier opening prompts instantly
+        self.cache_var = tk.BooleanVar(value=False)
+        cache_toggle = tk.Checkbutton(
+            model_frame,
+            text="Cache",
+            variable=self.cache_var,
+            bg=self.theme['bg_light'],
+            fg=self.theme['text_primary'],
+            selectcolor=self.theme['bg_dark'],
+            activebackground=self.theme['bg_light'],
+            activeforeground=self.theme['text_primary'],
+            font=("Segoe UI", 10)
+        )
+        cache_toggle.pack(side="left", padx=(5, 0))
+        
+        # Generation-option profiles for the selected model
+        self.profile_store = ProfileStore()
+        profile_label = tk.Label(
+            model_frame,
+            text="Profile:",
+            bg=self.theme['bg_light'],
+            fg=self.theme['text_primary'],
+            font=("Segoe UI", 10)
+        )
+        profile_label.pack(side="left", padx=(10, 5))
+        
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        self.profile_selector = ttk.Combobox(
+            model_frame,
+            textvariable=self.profile_var,
+            state="readonly",
+            values=[DEFAULT_PROFILE],
+            width=10,
+            style="Custom.TCombobox"
+        )
+        self.profile_selector.pack(side="left")
+        self.profile_selector.bind("<<ComboboxSelected>>", lambda e: self.profile_store.select(
+            self.model_var.get(), self.profile_var.get()
+        ))
+        self.model_var.trace_add("write", lambda *args: self.refresh_profiles())
+        self.model_var.trace_add("write", lambda *args: self.speculator.cancel())
+        
+        self.tune_button = ttk.Button(
+            model_frame,
+            text="Tune",
+            command=self.autotune_model,
+            style="Custom.TButton",
+            width=6
+        )
+        self.tune_button.pack(side="left", padx=5)
 
-        # Chat History
+        # Chat History, one tab per conversation
         history_frame = tk.Frame(self.root, bg=self.theme['bg_dark'])
         history_frame.pack(fill="both", expand=True, padx=20, pady=(10, 0))
         
-        self.chat_history = scrolledtext.ScrolledText(
-            history_frame,
+        self.tab_notebook = ttk.Notebook(history_frame, style="Custom.TNotebook")
+        self.tab_notebook.pack(fill="both", expand=True)
+        self.tab_notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.tab_notebook.bind("<Button-2>", self.close_tab)
+        self.new_tab(file_name="chat_history.json")
+        
+        self.create_input_area()
+
+    def new_tab(self, file_name=None):
+        """Open an empty conversation in a new tab and switch to it"""
+        frame = tk.Frame(self.tab_notebook, bg=self.theme['bg_dark'])
+        chat_history = scrolledtext.ScrolledText(
+            frame,
             wrap=tk.WORD,
             state="disabled",
             font=("Segoe UI", 11),
@@ -225,8 +471,58 @@ class ChatGUI:
             selectbackground=self.theme['accent_blue'],
             selectforeground=self.theme['text_primary']
         )
-        self.chat_history.pack(fill="both", expand=True)
+        chat_history.pack(fill="both", expand=True)
+        self.configure_code_highlighting(chat_history)
+        
+        if file_name is None:
+            # The suffix keeps tabs opened within the same second from sharing a file
+            file_name = f"chat_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.json"
+        tab = ChatTab(frame, chat_history, file_name)
+        self.tabs[str(frame)] = tab
+        if self.current_tab is None:
+            self.current_tab = tab
+        self.tab_notebook.add(frame, text=f"Chat {len(self.tabs)}")
+        self.tab_notebook.select(frame)
+        return tab
+
+    def close_tab(self, event):
+        """Middle-click closes an idle tab; the last tab always stays open"""
+        try:
+            index = self.tab_notebook.index(f"@{event.x},{event.y}")
+        except tk.TclError:
+            return
+        frame = self.tab_notebook.tabs()[index]
+        tab = self.tabs[frame]
+        if tab.streaming or len(self.tabs) == 1:
+            return
+        self.tab_notebook.forget(frame)
+        del self.tabs[frame]
+        tab.frame.destroy()
+
+    def on_tab_changed(self, event=None):
+        tab = self.tabs.get(self.tab_notebook.select())
+        if tab is None:
+            return
+        self.current_tab = tab
+        if not hasattr(self, 'footer_label'):
+            return  # Still building the window
+        
+        # Catch up on anything that finished while the tab was hidden
+        if tab.pending_reply is not None:
+            node = tab.pending_reply
+            tab.pending_reply = None
+            self._show_reply(tab, node)
+        elif tab.streaming:
+            self._draw_live(tab)
+        self.footer_label.config(text=tab.status)
+        self.send_button.config(state="disabled" if tab.streaming else "normal")
 
+    def _set_status(self, tab, text):
+        tab.status = text
+        if tab is self.current_tab:
+            self.footer_label.config(text=text)
+
+    def create_input_area(self):
         # Input Area
         input_frame = tk.Frame(self.root, bg=self.theme['bg_light'], height=100)
         input_frame.pack(side="bottom", fill="x", padx=20, pady=20)
@@ -247,6 +543,8 @@ class ChatGUI:
         )
         self.input_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
         self.input_entry.bind("<Return>", lambda event: self.send_message())
+        self.input_entry.bind("<KeyRelease>", self._schedule_warmup)
+        self.input_entry.bind("<FocusOut>", lambda event: self._cancel_warmup_timer())
 
         button_frame = tk.Frame(input_controls, bg=self.theme['bg_light'])
         button_frame.pack(side="right")
@@ -278,6 +576,59 @@ class ChatGUI:
         )
         self.send_button.pack(side="left", padx=5)
 
+    def _cancel_warmup_timer(self):
+        if self._warmup_after is not None:
+            self.root.after_cancel(self._warmup_after)
+            self._warmup_after = None
+
+    def _schedule_warmup(self, event=None):
+        """Debounce keystrokes; warm up once the user pauses"""
+        if not self.prefill_var.get() or event.keysym == "Return":
+            return
+        self._cancel_warmup_timer()
+        self._warmup_after = self.root.after(WARMUP_DELAY_MS, self._start_warmup)
+
+    def _start_warmup(self):
+        self._warmup_after = None
+        model = self.model_var.get()
+        if (not model or self.streaming or not self.prefill_var.get()
+                or self.root.focus_get() is not self.input_entry):
+            return
+        self.speculator.warm(model, self.conversation, self.profile_store.options(model),
+                             prefer=self.profile_store.host(model))
+
+    def refresh_profiles(self):
+        model = self.model_var.get()
+        self.profile_selector.configure(values=self.profile_store.names(model))
+        self.profile_var.set(self.profile_store.selected.get(model, DEFAULT_PROFILE))
+
+    def autotune_model(self):
+        """Benchmark thread/batch settings for the selected model and save the fastest"""
+        model = self.model_var.get()
+        if not model:
+            return
+        self.tune_button.config(state="disabled")
+        
+        def log(line):
+            self.root.after(0, lambda: self.footer_label.config(text=f"Status: Tuning {line}"))
+        
+        def run():
+            try:
+                # Tune where the pool would route this model; the profile then prefers that host
+                options, host = autotune_on_pool(self.backend_pool, model, log=log)
+                self.profile_store.put(model, AUTO_PROFILE, options, host)
+                self.profile_store.select(model, AUTO_PROFILE)
+                self.root.after(0, self.refresh_profiles)
+                self.root.after(0, lambda: self.footer_label.config(
+                    text=f"Status: Saved '{AUTO_PROFILE}' profile for {model} on {host}"
+                ))
+            except Exception as e:
+                self.root.after(0, messagebox.showerror, "Error", f"Auto-tune failed: {e}")
+            finally:
+                self.root.after(0, lambda: self.tune_button.config(state="normal"))
+        
+        threading.Thread(target=run, daemon=True).start()
+
     def create_footer(self):
         footer = tk.Frame(self.root, bg=self.theme['bg_medium'], height=30)  # Changed from accent_blue
         footer.pack(side="bottom", fill="x")
@@ -293,7 +644,7 @@ class ChatGUI:
         )
         self.footer_label.pack(side="left", padx=20, pady=5)
 
-    def configure_code_highlighting(self):
+    def configure_code_highlighting(self, chat_history):
         """Set up syntax highlighting colors and tags"""
         code_colors = {
             Token.Keyword: "#f92672",
@@ -304,21 +655,28 @@ class ChatGUI:
         }
         
         for token_type, color in code_colors.items():
-            self.chat_history.tag_config(str(token_type), foreground=color)
+            chat_history.tag_config(str(token_type), foreground=color)
             
-        self.chat_history.tag_config("codeblock", 
+        chat_history.tag_config("codeblock", 
             background="#2a2a2a", 
             relief="ridge", 
             borderwidth=1,
             font=("Consolas", 10)
         )
 
-    def update_chat_history(self, message_data):
+    def update_chat_history(self, message_data, node=None):
         self.chat_history.configure(state="normal")
         
+        # Mark where this message starts so a branch switch can cut from here
+        if node is not None:
+            self._mark_node(node)
+        
         # Add timestamp
         timestamp = datetime.fromisoformat(message_data.get("timestamp", datetime.now().isoformat()))
         time_str = timestamp.strftime("%I:%M %p")
+        branch = self.conversation.branch_label(node) if node is not None else ""
+        if branch:
+            time_str += f" • branch {branch}"
         
         # Insert avatar and header
         sender = message_data["sender"]
@@ -368,6 +726,8 @@ class ChatGUI:
                 borderwidth=0
             )
             content.pack(fill="both", expand=True)
+            if node is not None:
+                content.bind("<Button-3>", lambda e, n=node: self.show_branch_menu(e, n))
             
             # Insert message text
             text = message_data.get("text", "")
@@ -447,9 +807,11 @@ class ChatGUI:
                 borderwidth=0
             )
             content.pack(fill="both", expand=True)
+            if node is not None:
+                content.bind("<Button-3>", lambda e, n=node: self.show_branch_menu(e, n))
             
-            # Insert message text
-            text = message_data.get("text", "")
+            # Insert message text (older saves used "message" for replies)
+            text = message_data.get("text", message_data.get("message", ""))
             if text:
                 parts = self.split_code_blocks(text)
                 for part in parts:
@@ -480,13 +842,19 @@ class ChatGUI:
                 fill=self.theme['assistant_color'],
                 outline=self.theme['assistant_color']
             )
+            
+            if message_data.get("reasoning"):
+                self.chat_history.insert(tk.END, "\n")
+                self.insert_reasoning_toggle(message_data["reasoning"])
         
         # Insert attachments
         for att in message_data.get("attachments", []):
-            if att["type"] == "image":
-                # Display embedded image
-                img_data = att["data"]
-                img = Image.open(io.BytesIO(base64.b64decode(img_data)))
+            if att["type"] == "image" and ("data" in att or os.path.exists(att["path"])):
+                # Display the embedded image, or the file until it has been embedded
+                if "data" in att:
+                    img = Image.open(io.BytesIO(base64.b64decode(att["data"])))
+                else:
+                    img = Image.open(att["path"])
                 img.thumbnail((200, 200))
                 photo = ImageTk.PhotoImage(img)
                 self.chat_history.image_create(tk.END, image=photo)
@@ -500,6 +868,113 @@ class ChatGUI:
         self.chat_history.configure(state="disabled")
         self.chat_history.see(tk.END)
 
+    def _mark_node(self, node):
+        mark = f"node{node.id}"
+        self.chat_history.mark_set(mark, "end-1c")
+        self.chat_history.mark_gravity(mark, "left")
+
+    def render_branch(self):
+        """Redraw only the part of the chat below where the current branch diverges"""
+        new_path = self.conversation.path()
+        shared = ConversationTree.common_prefix(self.rendered_path, new_path)
+        
+        self.chat_history.configure(state="normal")
+        if shared < len(self.rendered_path):
+            self.chat_history.delete(f"node{self.rendered_path[shared].id}", tk.END)
+            for node in self.rendered_path[shared:]:
+                self.chat_history.mark_unset(f"node{node.id}")
+        self.chat_history.configure(state="disabled")
+        
+        for node in new_path[shared:]:
+            self.update_chat_history(node.message, node)
+        self.rendered_path = new_path
+
+    def show_branch_menu(self, event, node):
+        """Right-click menu for editing, regenerating and switching branches"""
+        if self.streaming:
+            return
+        menu = tk.Menu(self.root, tearoff=0)
+        if node.message.get("sender") == "You":
+            menu.add_command(label="Edit prompt", command=lambda: self.edit_message(node))
+        else:
+            menu.add_command(label="Regenerate reply", command=lambda: self.regenerate_response(node))
+            if node.id in self.current_tab.traces:
+                menu.add_command(label="Export timeline...", command=lambda: self.export_trace(node))
+        if self.conversation.branch_label(node):
+            menu.add_separator()
+            menu.add_command(label="Previous branch", command=lambda: self.switch_branch(node, -1))
+            menu.add_command(label="Next branch", command=lambda: self.switch_branch(node, 1))
+        menu.tk_popup(event.x_root, event.y_root)
+
+    def edit_message(self, node):
+        self.edit_target = node
+        self.input_entry.delete(0, tk.END)
+        self.input_entry.insert(0, node.message.get("text", ""))
+        self.input_entry.focus()
+        self._set_status(self.current_tab, "Status: Editing — Send creates a new branch")
+
+    def regenerate_response(self, node):
+        trace = self.tracer.new_trace()
+        with self.tracer.span("regenerate_response", trace):
+            user_node = self.conversation.fork(node)
+            with self.tracer.span("render_branch", trace):
+                self.render_branch()
+            self.start_response(user_node, use_cache=False, trace=trace)
+
+    def export_trace(self, node):
+        """Save the span timeline of the request that produced a reply"""
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            initialfile=f"trace-{node.id}.json",
+            filetypes=[("Chrome trace", "*.json")]
+        )
+        if path:
+            count = self.tracer.export(path, self.current_tab.traces[node.id])
+            self._set_status(self.current_tab,
+                             f"Status: Wrote {count} spans to {os.path.basename(path)} "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+
+    def switch_branch(self, node, step):
+        self.conversation.switch(node, step)
+        self.render_branch()
+        self.save_chat_to_file()
+
+    def insert_regenerate_link(self, node):
+        """Offer to replace a cached answer with a freshly generated one"""
+        tag = f"regenerate{node.id}"
+        self.chat_history.insert(tk.END, "    ↻ Cached answer — regenerate", ("reasoning_toggle", tag))
+        self.chat_history.insert(tk.END, "\n\n")
+        self.chat_history.tag_config(tag, foreground=self.theme['text_secondary'])
+        self.chat_history.tag_bind(tag, "<Button-1>", lambda e: not self.streaming and self.regenerate_response(node))
+        self.chat_history.tag_bind(tag, "<Enter>", lambda e: self.chat_history.config(cursor="hand2"))
+        self.chat_history.tag_bind(tag, "<Leave>", lambda e: self.chat_history.config(cursor=""))
+
+    def insert_reasoning_toggle(self, reasoning):
+        """Insert a collapsed reasoning header; the text is only laid out when expanded"""
+        tag = f"reasoning{next(self._reasoning_ids)}"
+        words = len(reasoning.split())
+        self.chat_history.insert(tk.END, f"▸ Reasoning ({words} words)", ("reasoning_toggle", tag))
+        self.chat_history.insert(tk.END, "\n")
+        self.chat_history.tag_config(tag, foreground=self.theme['text_secondary'])
+        self.chat_history.tag_bind(tag, "<Button-1>", lambda e: self.toggle_reasoning(tag, reasoning))
+        self.chat_history.tag_bind(tag, "<Enter>", lambda e: self.chat_history.config(cursor="hand2"))
+        self.chat_history.tag_bind(tag, "<Leave>", lambda e: self.chat_history.config(cursor=""))
+
+    def toggle_reasoning(self, tag, reasoning):
+        body = f"{tag}_body"
+        self.chat_history.configure(state="normal")
+        header_start = self.chat_history.index(f"{tag}.first")
+        expanded = bool(self.chat_history.tag_ranges(body))
+        if expanded:
+            self.chat_history.delete(f"{body}.first", f"{body}.last")
+        else:
+            self.chat_history.insert(f"{tag}.last + 1c", reasoning + "\n", ("reasoning_text", body))
+            self.chat_history.tag_config(body, foreground=self.theme['text_secondary'], lmargin1=40, lmargin2=40)
+        # Flip the arrow in place so nothing else shifts
+        self.chat_history.delete(header_start)
+        self.chat_history.insert(header_start, "▾" if not expanded else "▸", ("reasoning_toggle", tag))
+        self.chat_history.configure(state="disabled")
+
     def split_code_blocks(self, text):
         """Split message text into regular text and code blocks"""
         parts = []
@@ -586,58 +1061,30 @@ class ChatGUI:
             text_widget.insert(tk.END, content, tag)
 
     def ollama_chat(self, prompt):
-        model_name = self.model_var.get()
-        url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": model_name,
-            "prompt": prompt,
-            "stream": False,
-            "context": self.context
-        }
-        
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            response_data = json.loads(response.text)
-            
-            self.context = response_data.get("context")
-            return response_data.get("response", "")
+            return self.engine.generate(self.model_var.get(), prompt)
         except Exception as e:
             return f"Error: {str(e)}"
         
     def send_message(self):
         user_input = self.input_entry.get().strip()
-        if not user_input and not self.current_attachments:
-            return
-            
+        if self.streaming or (not user_input and not self.current_attachments):
+            return  # <Return> still reaches here while the Send button is disabled
+        
+        trace = self.tracer.new_trace()
+        with self.tracer.span("send_message", trace):
+            self._send_message(user_input, trace)
+
+    def _send_message(self, user_input, trace):
         # Create message object with attachments
-        message_data = {
-            "text": user_input,
-            "attachments": [],
-            "sender": "You",
-            "timestamp": datetime.now().isoformat()
-        }
+        with self.tracer.bind(trace):
+            message_data = self.engine.build_user_message(user_input, self.current_attachments)
         
-        # Process attachments
-        for file_path in self.current_attachments:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                # Encode image as base64
-                with open(file_path, "rb") as f:
-                    encoded = b64encode(f.read()).decode('utf-8')
-                message_data["attachments"].append({
-                    "type": "image",
-                    "data": encoded,
-                    "name": os.path.basename(file_path)
-                })
-            else:
-                # Store document path (or read content)
-                message_data["attachments"].append({
-                    "type": "document",
-                    "path": file_path,
-                    "name": os.path.basename(file_path)
-                })
-        
-        self.chat_history_data.append(message_data)
+        # An edited prompt becomes a sibling of the original, sharing its history
+        if self.edit_target is not None:
+            self.conversation.fork(self.edit_target)
+            self.edit_target = None
+        user_node = self.conversation.append(message_data)
         self.save_chat_to_file()
         
         # Clear attachments
@@ -646,132 +1093,273 @@ class ChatGUI:
             child.destroy()
         
         self.input_entry.delete(0, tk.END)
-        self.update_chat_history(message_data)
+        with self.tracer.span("render_branch", trace):
+            self.render_branch()
+        self.start_response(user_node, trace=trace)
+
+    def start_response(self, user_node, use_cache=True, trace=None):
+        tab = self.current_tab
         
         # Disable UI during processing
+        tab.streaming = True
+        tab.trace = trace
+        tab.reset_live()
         self.send_button.config(state="disabled")
-        self.footer_label.config(text="Status: Assistant is typing...")
+        self._set_status(tab, "Status: Assistant is typing...")
+        
+        # Read the settings on the Tk thread; the worker must not touch Tk variables
+        model = self.model_var.get()
+        request = {
+            "model": model,
+            "options": self.profile_store.options(model),
+            "json_mode": self.json_mode_var.get(),
+            "speculate": self.prefill_var.get(),
+            # A tuned profile only fits the host it was measured on
+            "prefer": self.profile_store.host(model),
+            "warm": False,
+            # Only opening prompts without attachments mean the same thing in any chat
+            "cache": (use_cache and self.cache_var.get() and not self.json_mode_var.get()
+                      and user_node.parent is self.conversation.root
+                      and not user_node.message.get("attachments"))
+        }
+        if request["speculate"]:
+            self._cancel_warmup_timer()
+            # The warm-up covered the branch up to the new prompt's parent
+            warm_host, _ = self.speculator.claim(model, self.conversation, user_node.parent)
+            if warm_host is None:
+                self.speculator.cancel()
+            else:
+                request["prefer"], request["warm"] = warm_host, True
         
         # Use proper streaming endpoint
-        threading.Thread(target=self.stream_llm_response, args=(user_input,)).start()
+        threading.Thread(target=self.traced_stream, args=(tab, user_node, request),
+                         name=f"reply-{trace}").start()
+
+    def traced_stream(self, tab, user_node, request):
+        with self.tracer.bind(tab.trace), self.tracer.span("stream_llm_response"):
+            self.stream_llm_response(tab, user_node, request)
 
-    def stream_llm_response(self, user_input):
+    def stream_llm_response(self, tab, user_node, request):
+        started = time.perf_counter()
+        first_piece = []
+        
+        def on_piece(channel, text):
+            if not first_piece:
+                first_piece.append(time.perf_counter() - started)
+            tab.add_piece(channel, text)
+        
         try:
-            # Start typing animation
-            self.root.after(0, self.start_typing_animation)
-            
-            url = "http://localhost:11434/api/chat"
-            payload = {
-                "model": self.model_var.get(),
-                "messages": [{"role": "user", "content": user_input}],
-                "stream": True,
-                "context": self.context
-            }
-
-            raw_response = []
-            with requests.post(url, json=payload, stream=True) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        chunk = json.loads(line)
-                        if chunk.get("message"):
-                            content = chunk["message"]["content"]
-                            raw_response.append(content)
-
-            # Stop typing animation and process response
-            self.root.after(0, self.stop_typing_animation)
-            
-            full_content = "".join(raw_response)
-            clean_content = full_content.replace("</think>", "").strip()
-            clean_content = ' '.join(clean_content.split())
-            
-            self.root.after(0, self.finalize_response, clean_content)
+            structured = None
+            vector = None
+            cache_error = None
+            attachments = user_node.message.get("attachments", [])
+            if any(a["type"] == "image" and "data" not in a for a in attachments):
+                # Embedded here rather than at Send so the Tk thread never waits on it
+                encoded = self.engine.encode_attachments(attachments)
+                self.root.after(0, self._store_attachments, tab, user_node, encoded)
+            if request["cache"]:
+                text = user_node.message["text"]
+                try:
+                    with self.tracer.span("semantic cache lookup"):
+                        hit, similarity, vector = self.semantic_cache.lookup(request["model"], text)
+                except Exception as e:
+                    # Generate as usual, but tell the user why the cache did nothing
+                    hit, cache_error = None, e
+                    self.root.after(0, self._set_status, tab,
+                                    f"Status: Assistant is typing... (cache unavailable: {e})")
+                if hit is not None:
+                    self.root.after(0, self.finalize_response, tab, hit["answer"], hit["reasoning"],
+                                    user_node, None, similarity)
+                    return
+            if request["json_mode"]:
+                structured, answer, reasoning = self.engine.stream_structured(
+                    request["model"], tab.conversation, user_node,
+                    on_event=lambda kind, path, value: self._on_structured_event(tab, kind, path),
+                    on_piece=on_piece,
+                    options=request["options"],
+                    prefer=request["prefer"]
+                )
+            else:
+                answer, reasoning = self.engine.stream_reply(
+                    request["model"], tab.conversation, user_node,
+                    on_piece=on_piece,
+                    options=request["options"],
+                    prefer=request["prefer"]
+                )
+
+            self.root.after(0, self.finalize_response, tab, answer, reasoning, user_node, structured)
+            if vector is not None:
+                self.semantic_cache.store(request["model"], vector, text, answer, reasoning)
+            if request["speculate"] and first_piece:
+                warm = request["warm"]
+                self.speculator.record_ttft(warm, first_piece[0])
+                self.root.after(0, self._set_status, tab,
+                    f"Status: Ready — TTFT {first_piece[0]:.2f}s ({'warm' if warm else 'cold'}); "
+                    f"{self.speculator.report()}")
+
+            if cache_error is not None:
+                self.root.after(0, self._set_status, tab, f"Status: Ready — cache unavailable: {cache_error}")
 
         except Exception as e:
-            self.root.after(0, self.stop_typing_animation)
-            self.root.after(0, messagebox.showerror, "Error", str(e))
-        finally:
-            self.root.after(0, lambda: self.send_button.config(state="normal"))
-            self.root.after(0, lambda: self.footer_label.config(text="Status: Ready"))
-
-    def start_typing_animation(self):
-        self.typing_active = True
-        self.typing_steps = [".  ", ".. ", "..."]
-        self.typing_step = 0
-        self._animate_typing()
+            self.root.after(0, self._stream_failed, tab, e)
 
-    def _animate_typing(self):
-        if not self.typing_active:
-            return
+    def _store_attachments(self, tab, user_node, attachments):
+        user_node.message["attachments"] = attachments
+        self.save_chat_to_file(tab)
+
+    def _stream_failed(self, tab, error):
+        tab.streaming = False
+        self._set_status(tab, "Status: Ready")
+        # A hidden tab may still show its typing indicator from when it was visible
+        self._clear_live(tab)
+        if tab is self.current_tab:
+            self.send_button.config(state="normal")
+        messagebox.showerror("Error", f"{error}\n\nConnection events: {self.backend_pool.events.summary()}")
+
+    def _on_structured_event(self, tab, kind, path):
+        """Show each completed top-level field as soon as it closes (worker thread)"""
+        if kind == "field" and len(path) == 1:
+            self.root.after(0, self._set_status, tab, f"Status: Received field '{path[0]}'...")
+
+    def _tick_live(self):
+        """Draw the visible tab's new streamed text; hidden tabs only buffer"""
+        self.live_ticks += 1
+        tab = self.current_tab
+        if tab is not None and tab.streaming:
+            self._draw_live(tab)
+        self.root.after(LIVE_INTERVAL_MS, self._tick_live)
+
+    def _draw_live(self, tab):
+        with self.tracer.span("draw live text", tab.trace):
+            self._draw_live_text(tab)
+
+    def _draw_live_text(self, tab):
+        widget = tab.chat_history
+        widget.configure(state="normal")
         
-        self.chat_history.configure(state="normal")
+        # Create the typing indicator the first time this tab is drawn while streaming
+        if not tab.live_shown:
+            widget.mark_set("live_start", "end-1c")
+            widget.mark_gravity("live_start", "left")
+            widget.image_create(tk.END, image=self.bot_icon, padx=5)
+            widget.insert(tk.END, "  ")
+            widget.mark_set("live_text", "end-1c")
+            widget.mark_gravity("live_text", "left")
+            tab.live_shown = True
+            with tab.lock:
+                tab.live_drawn = 0
         
-        # Create or update typing indicator
-        if hasattr(self, 'typing_indicator'):
-            self.chat_history.delete(self.typing_indicator, "end")
-        else:
-            self.chat_history.image_create(tk.END, image=self.bot_icon, padx=5)
-            self.typing_indicator = self.chat_history.index(tk.END)
+        if widget.tag_ranges("typing"):
+            widget.delete("typing.first", "typing.last")
+        reset, text = tab.take_new_text()
+        if reset:
+            widget.delete("live_text", tk.END)
+        if text:
+            widget.insert(tk.END, text, "assistant")
         
         # Insert current animation step
-        dots = self.typing_steps[self.typing_step]
-        self.chat_history.insert(tk.END, "  " + dots, "typing")
-        self.typing_step = (self.typing_step + 1) % len(self.typing_steps)
-        
-        self.chat_history.configure(state="disabled")
-        self.chat_history.see(tk.END)
+        dots = self.typing_steps[(self.live_ticks // 5) % len(self.typing_steps)]
+        widget.insert(tk.END, "  " + dots, "typing")
         
-        # Schedule next animation frame
-        self.root.after(500, self._animate_typing)
+        widget.configure(state="disabled")
+        widget.see(tk.END)
 
-    def stop_typing_animation(self):
-        self.typing_active = False
-        if hasattr(self, 'typing_indicator'):
-            self.chat_history.configure(state="normal")
-            self.chat_history.delete(self.typing_indicator, "end")
-            self.chat_history.configure(state="disabled")
-            del self.typing_indicator
+    def _clear_live(self, tab):
+        if tab.live_shown:
+            tab.chat_history.configure(state="normal")
+            tab.chat_history.delete("live_start", tk.END)
+            tab.chat_history.configure(state="disabled")
+            tab.live_shown = False
+        tab.reset_live()
 
-    def finalize_response(self, clean_content):
-        self.stop_typing_animation()
+    def finalize_response(self, tab, clean_content, reasoning, user_node, structured=None, cached=None):
+        with self.tracer.span("finalize_response", tab.trace):
+            self._finalize_response(tab, clean_content, reasoning, user_node, structured, cached)
+        # Geometry and redraw run as idle tasks queued ahead of this one
+        trace, done = tab.trace, time.perf_counter_ns()
+        self.root.after_idle(lambda: self.tracer.record(
+            "layout and paint", done, time.perf_counter_ns(), trace, track="MainThread"))
+
+    def _finalize_response(self, tab, clean_content, reasoning, user_node, structured, cached):
+        # Regenerated replies become siblings under the same prompt
+        node = self.engine.add_reply(tab.conversation, user_node, clean_content, reasoning, structured)
+        tab.traces[node.id] = tab.trace
+        tab.streaming = False
+        if cached is not None:
+            node.message["cached"] = round(cached, 3)
+            self._set_status(tab, f"Status: Answered from cache ({cached:.0%} similar); "
+                                  f"{self.semantic_cache.report()}")
+        else:
+            self._set_status(tab, "Status: Ready")
         
-        # Clean residual typing patterns
-        clean_content = re.sub(r'(\.\s*){3,}', '', clean_content)
-        clean_content = clean_content.strip()
+        # Save to history
+        with self.tracer.span("save_chat_to_file", tab.trace):
+            self.save_chat_to_file(tab)
+        
+        # A hidden tab is only drawn once the user switches to it
+        if tab is self.current_tab:
+            with self.tracer.span("render reply", tab.trace):
+                self._show_reply(tab, node)
+            self.send_button.config(state="normal")
+        else:
+            tab.pending_reply = node
+
+    def _show_reply(self, tab, node):
+        self._clear_live(tab)
+        clean_content = node.message["text"]
+        reasoning = node.message.get("reasoning", "")
+        self.rendered_path.append(node)
         
         self.chat_history.configure(state="normal")
+        self._mark_node(node)
         self.chat_history.image_create(tk.END, image=self.bot_icon, padx=5)
-        self.chat_history.insert(tk.END, "  " + clean_content + "\n\n", "assistant")
+        if reasoning:
+            self.chat_history.insert(tk.END, "  ")
+            self.insert_reasoning_toggle(reasoning)
+        reply_tag = f"reply{node.id}"
+        cached = node.message.get("cached") is not None
+        self.chat_history.insert(tk.END, "  " + clean_content + ("\n" if cached else "\n\n"),
+                                 ("assistant", reply_tag))
+        self.chat_history.tag_bind(reply_tag, "<Button-3>", lambda e, n=node: self.show_branch_menu(e, n))
+        if cached:
+            self.insert_regenerate_link(node)
         self.chat_history.configure(state="disabled")
-        
-        # Save to history
-        self.chat_history_data.append({"sender": "Assistant", "message": clean_content})
-        self.save_chat_to_file()
+        self.chat_history.see(tk.END)
 
-    def save_chat_to_file(self):
-        if not os.path.exists("history"):
-            os.makedirs("history")
-        file_name = "history/chat_history.json"
-        with open(file_name, "w") as f:
-            json.dump(self.chat_history_data, f, indent=4)
+    def save_chat_to_file(self, tab=None):
+        tab = tab or self.current_tab
+        is_new = not os.path.exists(f"history/{tab.file_name}")
+        self.engine.save_conversation(tab.conversation, tab.file_name)
+        if is_new:
+            self.load_saved_chats()
 
     def load_saved_chats(self):
         self.history_listbox.delete(0, tk.END)
-        if os.path.exists("history/chat_history.json"):
-            self.history_listbox.insert(tk.END, "chat_history.json")
+        if os.path.exists("history"):
+            for file_name in sorted(os.listdir("history")):
+                if file_name.endswith(".json"):
+                    self.history_listbox.insert(tk.END, file_name)
 
     def load_chat_from_history(self, event):
         selection = self.history_listbox.get(self.history_listbox.curselection())
         file_path = f"history/{selection}"
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                self.chat_history_data = json.load(f)
+        owner = next((t for t in self.tabs.values() if t.file_name == selection), None)
+        if owner is not None and owner is not self.current_tab:
+            # Two tabs saving one file would overwrite each other; show the open one instead
+            self.tab_notebook.select(owner.frame)
+            return
+        if os.path.exists(file_path) and not self.streaming:
+            self.conversation = self.engine.load_conversation(selection)
+            self.current_tab.file_name = selection
+            # Node ids restart in every tree, so the old traces and reply would attach to new nodes
+            self.current_tab.traces = {}
+            self.current_tab.pending_reply = None
 
             self.chat_history.configure(state="normal")
             self.chat_history.delete(1.0, tk.END)
-            for entry in self.chat_history_data:
-                self.update_chat_history(entry)
             self.chat_history.configure(state="disabled")
+            self.rendered_path = []
+            self.render_branch()
 
     def _load_resized_icon(self, filename):
         """Load and resize icon to 32x32 pixels"""
@@ -805,29 +1393,6 @@ class ChatGUI:
         picker.transient(self.root)
         picker.grab_set()
         
-        # Configure style
-        style = ttk.Style()
-        style.configure(
-            "Custom.TNotebook",
-            background=self.theme['bg_light'],
-            foreground=self.theme['text_primary']
-        )
-        style.configure(
-            "Custom.TNotebook.Tab",
-            background=self.theme['bg_medium'],
-            foreground=self.theme['text_primary'],
-            padding=[10, 2],
-            lightcolor=self.theme['bg_medium'],
-            darkcolor=self.theme['bg_medium']
-        )
-        style.map(
-            "Custom.TNotebook.Tab",
-            background=[("selected", self.theme['bg_dark'])],
-            foreground=[("selected", self.theme['text_primary'])],
-            lightcolor=[("selected", self.theme['bg_dark'])],
-            darkcolor=[("selected", self.theme['bg_dark'])]
-        )
-        
         # Add search entry
         search_frame = tk.Frame(picker, bg=self.theme['bg_light'])
         search_frame.pack(fill="x", padx=10, pady=10)
@@ -0,0 +1,139 @@
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+ANSWER = "answer"
+REASONING = "reasoning"
+RECLASSIFY = "reclassify"  # Marker: everything answered so far was really reasoning
+
+
+class ThinkRouter:
+    """Split a token stream into answer and reasoning channels at <think> tags.
+
+    A </think> before any <think> means the prompt template opened the
+    block, so the text so far is reclassified as reasoning. Once a block has
+    opened or been reclassified, a stray </think> in the answer is literal
+    text, e.g. a reply that talks about the tag.
+
+    Tags may be split across chunks, so the longest suffix that could still
+    grow into a tag is held back until the next chunk. Every character is
+    looked at a bounded number of times, keeping the whole pass linear.
+    """
+
+    def __init__(self):
+        self.channel = ANSWER
+        self.pending = ""
+        self.blocks = 0  # Reasoning blocks opened or reclassified so far
+
+    def feed(self, chunk):
+        """Return a list of (channel, text) pieces for this chunk"""
+        text = self.pending + chunk
+        self.pending = ""
+        pieces = []
+        pos = 0
+        next_open = -2  # Cached position of the next <think> at or after pos (-2: unknown)
+        while True:
+            if self.channel == REASONING:
+                index = text.find(THINK_CLOSE, pos)
+                if index == -1:
+                    break
+                pieces.append((REASONING, text[pos:index]))
+                self.channel = ANSWER
+                pos = index + len(THINK_CLOSE)
+                continue
+            if next_open < pos and next_open != -1:
+                next_open = text.find(THINK_OPEN, pos)
+            close = text.find(THINK_CLOSE, pos) if not self.blocks else -1
+            if close != -1 and (next_open == -1 or close < next_open):
+                # Some R1 templates open the reasoning block in the prompt itself
+                self.blocks += 1
+                pieces.append((RECLASSIFY, ""))
+                pieces.append((REASONING, text[pos:close]))
+                pos = close + len(THINK_CLOSE)
+                continue
+            if next_open == -1:
+                break
+            pieces.append((ANSWER, text[pos:next_open]))
+            if self.blocks:
+                pieces.append((REASONING, "\n\n"))  # Keep separate blocks apart
+            self.blocks += 1
+            self.channel = REASONING
+            pos = next_open + len(THINK_OPEN)
+        held = _partial_tag_length(text, pos)
+        pieces.append((self.channel, text[pos:len(text) - held]))
+        self.pending = text[len(text) - held:]
+        return [(channel, piece) for channel, piece in pieces if piece or channel == RECLASSIFY]
+
+    def finish(self):
+        pieces = [(self.channel, self.pending)] if self.pending else []
+        self.pending = ""
+        return pieces
+
+
+def _partial_tag_length(text, start):
+    """Length of the longest suffix of text[start:] that is a proper prefix of a think tag"""
+    longest = 0
+    for tag in (THINK_OPEN, THINK_CLOSE):
+        for size in range(min(len(tag) - 1, len(text) - start), longest, -1):
+            if text.endswith(tag[:size]):
+                longest = size
+                break
+    return longest
+
+
+class LeadingWhitespaceFilter:
+    """Drop whitespace before the first visible character of a channel"""
+
+    def __init__(self):
+        self.started = False
+
+    def feed(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+
+class ResponsePostProcessor:
+    """Streaming cleanup for model replies, applied chunk by chunk as they arrive.
+
+    Reasoning goes to its own channel instead of the answer, and the answer
+    keeps its newlines, indentation and code blocks as the model wrote them.
+    """
+
+    def __init__(self):
+        self.router = ThinkRouter()
+        self.filters = {
+            ANSWER: [LeadingWhitespaceFilter()],
+            REASONING: [LeadingWhitespaceFilter()]
+        }
+        self.parts = {ANSWER: [], REASONING: []}
+
+    def feed(self, chunk):
+        """Process one streamed chunk; returns the (channel, text) pieces it produced"""
+        return self._route(self.router.feed(chunk))
+
+    def finish(self):
+        """Flush held-back text and return (answer, reasoning)"""
+        self._route(self.router.finish())
+        return "".join(self.parts[ANSWER]).rstrip(), "".join(self.parts[REASONING]).rstrip()
+
+    def _route(self, pieces):
+        produced = []
+        for channel, text in pieces:
+            if channel == RECLASSIFY:
+                if self.parts[ANSWER]:
+                    # The reasoning has already begun, so its whitespace is content now
+                    for stream_filter in self.filters[REASONING]:
+                        if isinstance(stream_filter, LeadingWhitespaceFilter):
+                            stream_filter.started = True
+                self.parts[REASONING].extend(self.parts[ANSWER])
+                self.parts[ANSWER] = []
+                self.filters[ANSWER] = [LeadingWhitespaceFilter()]
+                produced.append((channel, text))
+                continue
+            for stream_filter in self.filters[channel]:
+                text = stream_filter.feed(text)
+            if text:
+                self.parts[channel].append(text)
+                produced.append((channel, text))
+        return produced
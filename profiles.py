@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import time
+
+import requests
+
+from engine import ChatEngine
+
+PROFILES_FILE = "profiles.json"
+DEFAULT_THREADS = (2, 4, 8, 16)  # Swept when the host's core count is not configured
+DEFAULT_PROFILE = "default"  # No options: use the server's defaults
+AUTO_PROFILE = "auto"
+BENCH_PROMPT = (
+    "Summarise the history of the printing press in a few sentences, "
+    "mentioning Gutenberg, movable type and the spread of literacy. "
+) * 8
+
+
+class ProfileStore:
+    """Named generation-option sets per model, kept in profiles.json.
+
+    A profile produced by tuning also records the host it was measured on,
+    since thread and batch settings only suit that machine; requests using
+    the profile prefer that host.
+    """
+
+    def __init__(self, path=PROFILES_FILE):
+        self.path = path
+        self.profiles = {}
+        self.selected = {}
+        self.hosts = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.profiles = data.get("profiles", {})
+            self.selected = data.get("selected", {})
+            self.hosts = data.get("hosts", {})
+
+    def names(self, model):
+        return [DEFAULT_PROFILE] + sorted(self.profiles.get(model, {}))
+
+    def options(self, model, name=None):
+        """Options for a profile (default: the model's selected one); None means server defaults"""
+        name = name or self.selected.get(model, DEFAULT_PROFILE)
+        return self.profiles.get(model, {}).get(name) or None
+
+    def host(self, model, name=None):
+        """Host a profile was tuned on (default: the model's selected one), or None"""
+        name = name or self.selected.get(model, DEFAULT_PROFILE)
+        return self.hosts.get(model, {}).get(name)
+
+    def select(self, model, name):
+        self.selected[model] = name
+        self.save()
+
+    def put(self, model, name, options, host=None):
+        self.profiles.setdefault(model, {})[name] = options
+        if host:
+            self.hosts.setdefault(model, {})[name] = host
+        else:
+            self.hosts.get(model, {}).pop(name, None)
+        self.save()
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({"profiles": self.profiles, "selected": self.selected, "hosts": self.hosts},
+                      f, indent=4)
+
+
+def benchmark(model, options, base_url, num_predict=48, run=0, timeout=600):
+    """One /api/generate run; returns (prefill tokens/s, decode tokens/s).
+
+    The run number is prepended to the prompt so Ollama cannot serve the
+    prefill from its prompt cache.
+    """
+    payload = {
+        "model": model,
+        "prompt": f"Run {run} {time.time_ns()}. {BENCH_PROMPT}",
+        "stream": False,
+        "options": dict(options, num_predict=num_predict)
+    }
+    response = requests.post(f"{base_url}/api/generate", json=payload, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    prefill = data.get("prompt_eval_count", 0) / max(data.get("prompt_eval_duration", 0) / 1e9, 1e-9)
+    decode = data.get("eval_count", 0) / max(data.get("eval_duration", 0) / 1e9, 1e-9)
+    return prefill, decode
+
+
+def candidate_threads(cores=None):
+    """Thread counts to sweep for a host with `cores` CPU cores (None: unknown)"""
+    if not cores:
+        return list(DEFAULT_THREADS)
+    return sorted({max(1, cores // 4), max(1, cores // 2), max(1, cores * 3 // 4), cores})
+
+
+def autotune_on_pool(pool, model, prefer=None, threads=None, **kwargs):
+    """Tune on the host the pool routes this model to; returns (best options, host).
+
+    Without explicit `threads`, the sweep follows the host's `cores` entry
+    in backends.json, since this machine's core count says nothing about it.
+    """
+    def send(base_url):
+        backend = pool.find(base_url)
+        sweep = threads or candidate_threads(backend.cores if backend else None)
+        options, _ = autotune(model, base_url, threads=sweep, **kwargs)
+        return options, base_url
+
+    return pool.request(model, send, prefer=prefer)
+
+
+def autotune(model, base_url, threads=None, batches=(128, 256, 512),
+             num_ctx=2048, repeats=2, log=print):
+    """Sweep num_thread x num_batch for one model on one host and return (best options, results).
+
+    Decode speed decides the winner because it dominates reply time on CPU;
+    prefill speed breaks ties. Each setting is measured `repeats` times and
+    the best run is kept to reduce noise.
+    """
+    # Load the model once so load time does not count against the first setting
+    benchmark(model, {"num_ctx": num_ctx}, base_url, num_predict=1)
+    results = []
+    for num_thread in threads or candidate_threads():
+        for num_batch in batches:
+            options = {"num_ctx": num_ctx, "num_thread": num_thread, "num_batch": num_batch}
+            runs = [benchmark(model, options, base_url, run=i) for i in range(repeats)]
+            prefill = max(r[0] for r in runs)
+            decode = max(r[1] for r in runs)
+            results.append((options, prefill, decode))
+            log(f"{model}: threads={num_thread:<3} batch={num_batch:<4} "
+                f"prefill {prefill:7.1f} tok/s  decode {decode:6.1f} tok/s")
+    best = max(results, key=lambda r: (round(r[2], 1), r[1]))
+    return best[0], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark installed models and save the fastest options")
+    parser.add_argument("--host", help="Prefer this configured host (default: the one the pool picks)")
+    parser.add_argument("--model", action="append", help="Model to tune (default: all installed)")
+    parser.add_argument("--threads", type=int, nargs="+",
+                        help="num_thread values to sweep (default: from the host's cores in backends.json)")
+    parser.add_argument("--num-ctx", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    engine = ChatEngine()
+    models = args.model or engine.refresh_models()
+
+    store = ProfileStore()
+    for model in models:
+        try:
+            options, host = autotune_on_pool(engine.pool, model, prefer=args.host, threads=args.threads,
+                                             num_ctx=args.num_ctx, repeats=args.repeats)
+        except requests.RequestException as e:
+            print(f"{model}: skipped ({e})")
+            continue
+        store.put(model, AUTO_PROFILE, options, host)
+        store.select(model, AUTO_PROFILE)
+        print(f"{model}: saved '{AUTO_PROFILE}' profile {options} for {host}")
+
+
+if __name__ == "__main__":
+    main()
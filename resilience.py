@@ -0,0 +1,199 @@
+import random
+import socket
+import threading
+import time
+from collections import Counter, deque
+
+import requests
+
+
+class StreamTimeout(requests.Timeout):
+    """Raised when a streaming response misses its first-byte or inter-token deadline"""
+
+    def __init__(self, kind, seconds):
+        super().__init__(f"{kind} timeout after {seconds:.1f}s")
+        self.kind = kind
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of contacting a host whose circuit breaker is open"""
+
+
+class ModelUnavailableError(requests.RequestException):
+    """Raised when no configured host has the requested model installed"""
+
+
+class EventLog:
+    """Thread-safe counters plus a short ring of recent timeout/retry/breaker events"""
+
+    def __init__(self, maxlen=200):
+        self.counts = Counter()
+        self.recent = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+
+    def record(self, kind, host=None, detail=None):
+        with self.lock:
+            self.counts[kind] += 1
+            self.recent.append({
+                "time": time.time(),
+                "kind": kind,
+                "host": host,
+                "detail": detail
+            })
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts), list(self.recent)
+
+    def summary(self):
+        counts, _ = self.snapshot()
+        return ", ".join(f"{kind}={n}" for kind, n in sorted(counts.items())) or "no events"
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after repeated failures, lets one probe through after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def available(self):
+        """Non-mutating check used when ranking hosts"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return self.state == self.CLOSED
+
+    def allow(self):
+        """Whether a request may be sent now; moves open -> half-open after the cool-down"""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            if self.state == self.HALF_OPEN:
+                return False  # A probe is already in flight
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Count a failure; returns True if this call tripped the breaker open"""
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                tripped = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return tripped
+            return False
+
+
+class TimeoutPolicy:
+    """Deadlines for a single request"""
+
+    def __init__(self, connect=5.0, first_byte=120.0, stall=30.0):
+        self.connect = connect
+        self.first_byte = first_byte  # Covers model load and prompt prefill
+        self.stall = stall  # Longest allowed gap between streamed tokens
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            connect=config.get("connect_timeout", 5.0),
+            first_byte=config.get("first_byte_timeout", 120.0),
+            stall=config.get("stall_timeout", 30.0)
+        )
+
+    def requests_timeout(self):
+        """(connect, read) tuple for requests; the stream watchdog enforces the tighter deadlines"""
+        return (self.connect, max(self.first_byte, self.stall))
+
+
+def _stream_socket(response):
+    """The socket under a streaming requests response, or None if it cannot be reached"""
+    fp = getattr(response.raw, "_fp", None)  # http.client.HTTPResponse
+    raw = getattr(getattr(fp, "fp", None), "raw", None)  # socket.SocketIO
+    sock = getattr(raw, "_sock", None)
+    if sock is None:
+        sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    return sock
+
+
+def abort(response):
+    """Wake a reader blocked in recv on this response.
+
+    Closing the response from another thread does not interrupt a blocked
+    recv; shutting the socket down does, because the read returns EOF at once.
+    """
+    sock = _stream_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def iter_stream_lines(response, policy, events=None, host=None):
+    """Iterate NDJSON lines from a streaming response under first-byte and stall deadlines.
+
+    A watchdog thread shuts the connection down when a deadline passes,
+    which unblocks the reader; the resulting error is turned into StreamTimeout.
+    """
+    state = {"deadline": time.monotonic() + policy.first_byte, "kind": "first_byte",
+             "limit": policy.first_byte, "fired": False}
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(0.25):
+            if time.monotonic() > state["deadline"]:
+                state["fired"] = True
+                abort(response)
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        for line in response.iter_lines():
+            if state["fired"]:
+                break
+            state["deadline"] = time.monotonic() + policy.stall
+            state["kind"] = "stall"
+            state["limit"] = policy.stall
+            if line:
+                yield line
+    except Exception:
+        if not state["fired"]:
+            raise
+    finally:
+        done.set()
+    if state["fired"]:
+        if events is not None:
+            events.record(f"{state['kind']}_timeout", host=host)
+        raise StreamTimeout(state["kind"], state["limit"])
+
+
+def retry(func, attempts=3, base_delay=0.25, max_delay=4.0, events=None, host=None):
+    """Call an idempotent func, retrying connection errors with full-jitter exponential backoff"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == attempts - 1:
+                raise
+            if events is not None:
+                events.record("retry", host=host, detail=str(e))
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+
+CACHE_FILE = "semantic_cache.npz"
+DEFAULT_EMBED_MODEL = "nomic-embed-text"
+SAVE_INTERVAL = 60.0  # Seconds between writes of the index; save() also runs on exit
+
+
+class EmbeddingUnavailable(RuntimeError):
+    """The embedding model is not installed on any healthy host"""
+
+
+class SemanticCache:
+    """Answers to earlier prompts, looked up by embedding similarity.
+
+    Each prompt is embedded with a local Ollama embedding model. Vectors are
+    L2-normalised and kept as rows of one preallocated float32 matrix, so a
+    lookup is a single matrix-vector product over the rows for that chat
+    model. Once max_entries rows are used, the least recently used row is
+    overwritten. Entries are only meaningful for prompts that open a
+    conversation; the caller decides which prompts qualify. New entries are
+    written to disk at most every SAVE_INTERVAL seconds and by save().
+    """
+
+    def __init__(self, engine, embed_model=DEFAULT_EMBED_MODEL, threshold=0.92,
+                 max_entries=500, path=CACHE_FILE):
+        self.engine = engine
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.lock = threading.Lock()
+        self.vectors = None  # (max_entries, dim), allocated on the first store
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.entries = []  # Row i: {"model", "prompt", "answer", "reasoning"}
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "evictions": 0,
+                      "embed_secs": 0.0, "search_secs": 0.0}
+        if path and os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def from_env(cls, engine):
+        """Configure from CHAT_CACHE_* environment variables"""
+        return cls(
+            engine,
+            embed_model=os.environ.get("CHAT_CACHE_EMBED_MODEL", DEFAULT_EMBED_MODEL),
+            threshold=float(os.environ.get("CHAT_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.environ.get("CHAT_CACHE_SIZE", "500"))
+        )
+
+    def _installed_model(self):
+        """The embedding model's name as the hosts list it, or raise EmbeddingUnavailable"""
+        models = self.engine.pool.list_models()
+        for name in (self.embed_model, f"{self.embed_model}:latest"):
+            if name in models:
+                return name
+        raise EmbeddingUnavailable(
+            f"embedding model '{self.embed_model}' is not installed (ollama pull {self.embed_model})"
+        )
+
+    def embed(self, text):
+        """Normalised embedding of text from Ollama's /api/embed"""
+        # Checked up front so a missing model is not counted as load shedding by the pool
+        model = self._installed_model()
+
+        def send(base_url):
+            response = requests.post(
+                f"{base_url}/api/embed",
+                json={"model": model, "input": text},
+                timeout=self.engine.pool.policy.requests_timeout()
+            )
+            response.raise_for_status()
+            return response.json()["embeddings"][0]
+
+        started = time.perf_counter()
+        vector = np.asarray(self.engine.pool.request(model, send), dtype=np.float32)
+        with self.lock:
+            self.stats["embed_secs"] += time.perf_counter() - started
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, model, text):
+        """Return (entry or None, similarity, vector); pass vector on to store() after a miss"""
+        vector = self.embed(text)
+        started = time.perf_counter()
+        with self.lock:
+            self.stats["lookups"] += 1
+            best, score = None, 0.0
+            rows = [i for i, e in enumerate(self.entries) if e["model"] == model]
+            if rows and self.vectors is not None and self.vectors.shape[1] == vector.shape[0]:
+                scores = self.vectors[rows] @ vector
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    best, score = rows[i], float(scores[i])
+            self.stats["search_secs"] += time.perf_counter() - started
+            if best is None:
+                return None, score, vector
+            self.stats["hits"] += 1
+            self.last_used[best] = time.time()
+            return dict(self.entries[best]), score, vector
+
+    def store(self, model, vector, text, answer, reasoning=""):
+        entry = {"model": model, "prompt": text, "answer": answer, "reasoning": reasoning}
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start a fresh index
+                self.vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self.entries = []
+            if len(self.entries) < self.max_entries:
+                row = len(self.entries)
+                self.entries.append(entry)
+            else:
+                row = int(np.argmin(self.last_used))
+                self.entries[row] = entry
+                self.stats["evictions"] += 1
+            self.vectors[row] = vector
+            self.last_used[row] = time.time()
+            self.stats["stores"] += 1
+            self.dirty = True
+            due = time.monotonic() - self.last_save >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.vectors = None
+            self.entries = []
+            self.last_used[:] = 0
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def save(self):
+        """Write the index if it changed since the last save"""
+        if not self.path:
+            return
+        with self.lock:
+            if self.vectors is None or not self.dirty:
+                return
+            self.dirty = False
+            self.last_save = time.monotonic()
+            count = len(self.entries)
+            np.savez_compressed(
+                self.path,
+                vectors=self.vectors[:count],
+                last_used=self.last_used[:count],
+                entries=np.array(json.dumps(self.entries))
+            )
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            entries = json.loads(str(data["entries"]))[:self.max_entries]
+            vectors = data["vectors"][:len(entries)]
+            last_used = data["last_used"][:len(entries)]
+        if not entries:
+            return
+        self.vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+        self.vectors[:len(entries)] = vectors
+        self.last_used[:len(entries)] = last_used
+        self.entries = entries
+
+    def report(self):
+        """One-line summary of hit rate, lookup latency and index size"""
+        with self.lock:
+            lookups = self.stats["lookups"]
+            line = (f"cache hits {self.stats['hits']}/{lookups}"
+                    f" ({self.stats['hits'] / lookups:.0%})" if lookups else "cache hits 0/0")
+            if lookups:
+                line += (f", embed {self.stats['embed_secs'] / lookups * 1000:.0f} ms"
+                         f" + search {self.stats['search_secs'] / lookups * 1000:.1f} ms avg")
+            return (line + f", {len(self.entries)}/{self.max_entries} entries"
+                    f", {self.stats['evictions']} evicted")
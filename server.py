@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from conversation import ConversationTree
+from engine import ChatEngine
+
+MAX_BODY = 10 * 1024 * 1024
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests",
+    500: "Internal Server Error", 503: "Service Unavailable"
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    """One user's conversation held by the server"""
+
+    def __init__(self, user, model=None):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.model = model
+        self.conversation = ConversationTree()
+        self.lock = asyncio.Lock()  # One reply at a time per conversation
+        self.last_used = time.monotonic()
+
+
+class ChatServer:
+    """Multi-user HTTP front end for ChatEngine.
+
+    Connections are multiplexed on one asyncio loop; blocking Ollama streams
+    run on a bounded thread pool and their pieces are relayed back to the
+    loop, then written out as chunked NDJSON. Users are identified by the
+    X-User header and can only see their own sessions. Sessions idle for
+    longer than session_ttl are dropped, and each user and the server as a
+    whole hold a bounded number; creating one past a cap evicts the least
+    recently used idle session.
+
+    API:
+        GET  /api/models
+        GET  /api/stats
+        POST /api/sessions                  {"model": ...}
+        GET  /api/sessions/<id>
+        DELETE /api/sessions/<id>
+        POST /api/sessions/<id>/messages    {"text": ..., "model": ..., "format": ...}
+    """
+
+    def __init__(self, engine=None, max_streams=8, max_streams_per_user=2, queue_timeout=30.0,
+                 max_sessions=1000, max_sessions_per_user=20, session_ttl=3600.0):
+        self.engine = engine or ChatEngine()
+        self.max_streams = max_streams
+        self.max_streams_per_user = max_streams_per_user
+        self.queue_timeout = queue_timeout
+        self.max_sessions = max_sessions
+        self.max_sessions_per_user = max_sessions_per_user
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.user_streams = {}
+        self.stats = {"requests": 0, "streams_started": 0, "streams_completed": 0,
+                      "streams_failed": 0, "rejected": 0, "active_streams": 0,
+                      "sessions_evicted": 0}
+        self._slots = None
+        self._executor = ThreadPoolExecutor(max_workers=max_streams, thread_name_prefix="ollama")
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        self._slots = asyncio.Semaphore(self.max_streams)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        expiry = asyncio.create_task(self._expire_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            expiry.cancel()
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.session_ttl))
+            self.expire_sessions()
+
+    def expire_sessions(self):
+        """Drop sessions that have been idle for longer than session_ttl"""
+        cutoff = time.monotonic() - self.session_ttl
+        for session in list(self.sessions.values()):
+            if session.last_used < cutoff and not session.lock.locked():
+                self._drop_session(session)
+
+    def _drop_session(self, session):
+        del self.sessions[session.id]
+        self.stats["sessions_evicted"] += 1
+
+    def _make_room(self, user):
+        """Evict least recently used idle sessions so `user` may open one more"""
+        self.expire_sessions()
+        self._evict_lru([s for s in self.sessions.values() if s.user == user],
+                        self.max_sessions_per_user, 429)
+        self._evict_lru(list(self.sessions.values()), self.max_sessions, 503)
+
+    def _evict_lru(self, sessions, limit, status):
+        idle = sorted((s for s in sessions if not s.lock.locked()), key=lambda s: s.last_used)
+        excess = len(sessions) - limit + 1
+        if excess > len(idle):
+            raise HTTPError(status, "Too many sessions are streaming; try again later")
+        for session in idle[:max(0, excess)]:
+            self._drop_session(session)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            method, path, headers, body = await self.read_request(reader)
+            self.stats["requests"] += 1
+            await self.route(method, path, headers, body, writer)
+        except HTTPError as e:
+            await self.send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        except Exception as e:
+            await self.send_json(writer, 500, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path.rstrip("/"), headers, body
+
+    async def route(self, method, path, headers, body, writer):
+        user = headers.get("x-user", "anonymous")
+        parts = path.strip("/").split("/")
+
+        if method == "GET" and path == "/api/models":
+            await self.send_json(writer, 200, {"models": self.engine.pool.list_models()})
+        elif method == "GET" and path == "/api/stats":
+            counts, _ = self.engine.pool.events.snapshot()
+            await self.send_json(writer, 200, dict(self.stats, sessions=len(self.sessions), events=counts))
+        elif method == "POST" and path == "/api/sessions":
+            data = self.parse_json(body)
+            self._make_room(user)
+            session = Session(user, data.get("model"))
+            self.sessions[session.id] = session
+            await self.send_json(writer, 201, {"session_id": session.id})
+        elif method == "GET" and len(parts) == 3 and parts[:2] == ["api", "sessions"]:
+            session = self.get_session(parts[2], user)
+            await self.send_json(writer, 200, {
+                "session_id": session.id,
+                "model": session.model,
+                "messages": session.conversation.messages()
+            })
+        elif method == "DELETE" and len(parts) == 3 and parts[:2] == ["api", "sessions"]:
+            session = self.get_session(parts[2], user)
+            if session.lock.locked():
+                raise HTTPError(409, "A reply is still streaming in this session")
+            del self.sessions[session.id]
+            await self.send_json(writer, 200, {"deleted": session.id})
+        elif method == "POST" and len(parts) == 4 and parts[:2] == ["api", "sessions"] and parts[3] == "messages":
+            session = self.get_session(parts[2], user)
+            await self.stream_message(session, self.parse_json(body), writer)
+        else:
+            raise HTTPError(404, f"No route for {method} {path}")
+
+    def parse_json(self, body):
+        try:
+            return json.loads(body) if body else {}
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+
+    def get_session(self, session_id, user):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, "Unknown session")
+        if session.user != user:
+            raise HTTPError(403, "Session belongs to another user")
+        session.last_used = time.monotonic()
+        return session
+
+    async def stream_message(self, session, data, writer):
+        model = data.get("model") or session.model
+        if not model:
+            raise HTTPError(400, "No model given for this session")
+        if self.user_streams.get(session.user, 0) >= self.max_streams_per_user:
+            self.stats["rejected"] += 1
+            raise HTTPError(429, "Too many concurrent replies for this user")
+        if session.lock.locked():
+            raise HTTPError(409, "A reply is already streaming in this session")
+
+        # Count the user's stream before waiting so parallel requests see it
+        self.user_streams[session.user] = self.user_streams.get(session.user, 0) + 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.user_streams[session.user] -= 1
+            self.stats["rejected"] += 1
+            raise HTTPError(503, "Server is at its stream limit, try again later")
+
+        self.stats["active_streams"] += 1
+        self.stats["streams_started"] += 1
+        try:
+            async with session.lock:
+                await self._relay_reply(session, model, data.get("text", ""), writer,
+                                        data.get("format"))
+                session.last_used = time.monotonic()
+        finally:
+            self.stats["active_streams"] -= 1
+            self.user_streams[session.user] -= 1
+            self._slots.release()
+
+    async def _relay_reply(self, session, model, text, writer, schema=None):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        conversation = session.conversation
+        user_node = conversation.append(self.engine.build_user_message(text))
+
+        def on_piece(channel, piece):
+            loop.call_soon_threadsafe(queue.put_nowait, {"channel": channel, "text": piece})
+
+        def on_event(kind, path, value):
+            loop.call_soon_threadsafe(queue.put_nowait, {"event": kind, "path": list(path), "value": value})
+
+        if schema is not None:
+            future = loop.run_in_executor(
+                self._executor,
+                lambda: self.engine.stream_structured(model, conversation, user_node, schema, on_event, on_piece)
+            )
+        else:
+            future = loop.run_in_executor(
+                self._executor,
+                lambda: (None,) + self.engine.stream_reply(model, conversation, user_node, on_piece)
+            )
+        future.add_done_callback(lambda f: queue.put_nowait(None))
+
+        writer.write(self.status_line(200) + (
+            "Content-Type: application/x-ndjson\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode())
+        client_gone = False
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            if not client_gone:
+                try:
+                    await self.write_chunk(writer, event)
+                except ConnectionError:
+                    client_gone = True  # Keep draining; the reply is still recorded
+
+        try:
+            structured, answer, reasoning = future.result()
+        except Exception as e:
+            # Drop the unanswered prompt so the next message does not follow it
+            conversation.remove(user_node)
+            self.stats["streams_failed"] += 1
+            final = {"done": True, "error": str(e)}
+        else:
+            node = self.engine.add_reply(conversation, user_node, answer, reasoning, structured)
+            self.stats["streams_completed"] += 1
+            final = {"done": True, "answer": node.message["text"], "reasoning": reasoning}
+            if structured is not None:
+                final["data"] = structured
+        if not client_gone:
+            await self.write_chunk(writer, final)
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    async def write_chunk(self, writer, obj):
+        data = (json.dumps(obj) + "\n").encode()
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    def status_line(self, status):
+        return f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n".encode()
+
+    async def send_json(self, writer, status, obj):
+        data = json.dumps(obj).encode()
+        writer.write(self.status_line(status) + (
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chat engine over HTTP for multiple users")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-streams", type=int, default=8, help="Concurrent Ollama streams")
+    parser.add_argument("--max-streams-per-user", type=int, default=2)
+    parser.add_argument("--queue-timeout", type=float, default=30.0,
+                        help="Seconds a request may wait for a free stream slot")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--max-sessions-per-user", type=int, default=20)
+    parser.add_argument("--session-ttl", type=float, default=3600.0,
+                        help="Seconds of inactivity before a session is dropped")
+    args = parser.parse_args()
+
+    server = ChatServer(
+        max_streams=args.max_streams,
+        max_streams_per_user=args.max_streams_per_user,
+        queue_timeout=args.queue_timeout,
+        max_sessions=args.max_sessions,
+        max_sessions_per_user=args.max_sessions_per_user,
+        session_ttl=args.session_ttl
+    )
+    server.engine.pool.check_all()
+    server.engine.pool.start()
+    print(f"Serving on http://{args.host}:{args.port}")
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
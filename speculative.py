@@ -0,0 +1,137 @@
+import json
+import threading
+
+import requests
+
+from resilience import abort
+
+
+class PrefillSpeculator:
+    """Warms Ollama's KV cache with the conversation so far while the user is still typing.
+
+    A warm-up sends the current branch to /api/chat with num_predict 0, so
+    the server prefills the prompt but generates nothing. When the real
+    request arrives with the same prefix plus the new message, only the new
+    message needs prefilling. Warm-ups run one at a time; starting a new one
+    or calling cancel() aborts the one in flight.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self._generation = 0
+        self._response = None
+        self.warmed = None  # (model, conversation id, node id, host, prefill seconds)
+        self.stats = {"warmups": 0, "cancelled": 0, "failed": 0, "hits": 0, "misses": 0}
+        self.ttft = {"warm": [], "cold": []}
+
+    def _key(self, model, conversation, node=None):
+        node = node if node is not None else conversation.current
+        return (model, id(conversation), node.id)
+
+    def is_warm(self, model, conversation):
+        with self.lock:
+            return self.warmed is not None and self.warmed[:3] == self._key(model, conversation)
+
+    def warm(self, model, conversation, options=None, prefer=None):
+        """Start a background warm-up for the current branch unless it is already warm"""
+        if self.is_warm(model, conversation):
+            return
+        self.cancel()
+        with self.lock:
+            generation = self._generation
+        payload = self.engine.build_chat_payload(model, conversation, conversation.current)
+        payload["options"] = dict(options or {}, num_predict=0)
+        key = self._key(model, conversation)
+        threading.Thread(
+            target=self._run, args=(generation, key, model, payload, prefer), daemon=True
+        ).start()
+
+    def _run(self, generation, key, model, payload, prefer=None):
+        def send(base_url):
+            with requests.post(
+                f"{base_url}/api/chat",
+                json=payload,
+                stream=True,
+                timeout=self.engine.pool.policy.requests_timeout()
+            ) as response:
+                with self.lock:
+                    if generation != self._generation:
+                        return None
+                    self._response = response
+                response.raise_for_status()
+                final = {}
+                try:
+                    for line in response.iter_lines():
+                        if line:
+                            final = json.loads(line)
+                except Exception:
+                    # cancel() aborted the response; that says nothing about the host
+                    with self.lock:
+                        if generation != self._generation:
+                            return None
+                    raise
+                return base_url, final
+
+        try:
+            result = self.engine.pool.request(model, send, prefer=prefer)
+        except Exception:
+            with self.lock:
+                if generation == self._generation:
+                    self.stats["failed"] += 1
+            return
+        finally:
+            with self.lock:
+                self._response = None
+        with self.lock:
+            if result is None or generation != self._generation:
+                return
+            host, final = result
+            prefill = final.get("prompt_eval_duration", 0) / 1e9
+            self.warmed = key + (host, prefill)
+            self.stats["warmups"] += 1
+
+    def cancel(self):
+        """Abandon any warm-up in flight and forget what is warm (e.g. on model switch)"""
+        with self.lock:
+            self._generation += 1
+            response = self._response
+            self._response = None
+            if response is not None:
+                self.stats["cancelled"] += 1
+            self.warmed = None
+        if response is not None:
+            abort(response)  # close() alone leaves the warm-up thread blocked in recv
+
+    def claim(self, model, conversation, node=None):
+        """Called at Send time with the node the new prompt hangs off.
+
+        Returns (preferred host, prefill seconds the warm-up took), or
+        (None, 0.0) if that prefix was not warmed.
+        """
+        with self.lock:
+            if self.warmed is not None and self.warmed[:3] == self._key(model, conversation, node):
+                self.stats["hits"] += 1
+                host, prefill = self.warmed[3], self.warmed[4]
+                self.warmed = None
+                return host, prefill
+            self.stats["misses"] += 1
+            return None, 0.0
+
+    def record_ttft(self, warm, seconds):
+        with self.lock:
+            self.ttft["warm" if warm else "cold"].append(seconds)
+            del self.ttft["warm" if warm else "cold"][:-100]
+
+    def report(self):
+        """One-line summary of warm-up hits and average TTFT with and without them"""
+        with self.lock:
+            warm, cold = self.ttft["warm"], self.ttft["cold"]
+            line = (f"warm-ups {self.stats['warmups']}, hits {self.stats['hits']}, "
+                    f"misses {self.stats['misses']}, cancelled {self.stats['cancelled']}")
+            if warm and cold:
+                warm_avg = sum(warm) / len(warm)
+                cold_avg = sum(cold) / len(cold)
+                line += (f"; TTFT warm {warm_avg:.2f}s vs cold {cold_avg:.2f}s "
+                         f"(saved {cold_avg - warm_avg:.2f}s)")
+            return line
@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+LOG_FILE = "logs/stalls.log"
+KEY_REPORT_EVERY = 100  # Keystrokes per input-latency summary
+
+
+class StallMonitor:
+    """Watchdog for the Tk main thread.
+
+    A heartbeat scheduled with `after` stamps the time on every tick; a
+    sampler thread compares that stamp with the clock and, once the event
+    loop is late by more than `threshold` seconds, samples the main thread's
+    stack until the loop catches up. Each stall is appended to a log file.
+
+    It also times keystrokes: the delay between the X server stamping a key
+    event and Tk handling it, relative to the fastest delay seen so far,
+    is summarised every KEY_REPORT_EVERY keys under `label`.
+    """
+
+    def __init__(self, root, threshold=0.2, interval=0.05, log_path=LOG_FILE,
+                 trace_memory=False, max_samples=50, label=""):
+        self.root = root
+        self.threshold = threshold
+        self.interval = interval
+        self.log_path = log_path
+        self.trace_memory = trace_memory
+        self.max_samples = max_samples
+        self.main_thread_id = threading.main_thread().ident
+        self.last_beat = time.monotonic()
+        self.stall_count = 0
+        self.worst_lag = 0.0
+        self.label = label
+        self.key_lags = []
+        self._key_offset = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, root, label=""):
+        """Configure from CHAT_STALL_* environment variables; None if disabled"""
+        if os.environ.get("CHAT_STALL_MONITOR", "1") == "0":
+            return None
+        return cls(
+            root,
+            threshold=float(os.environ.get("CHAT_STALL_THRESHOLD_MS", "200")) / 1000,
+            log_path=os.environ.get("CHAT_STALL_LOG", LOG_FILE),
+            trace_memory=os.environ.get("CHAT_STALL_TRACEMALLOC") == "1",
+            label=label
+        )
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self.last_beat = time.monotonic()
+        self._beat()
+        self.root.bind_all("<KeyPress>", self._on_key, add="+")
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        if self._stop.is_set():
+            return
+        self.last_beat = time.monotonic()
+        self.root.after(int(self.interval * 1000), self._beat)
+
+    def _on_key(self, event):
+        # event.time is the X server's millisecond clock, so only differences are meaningful
+        offset = time.monotonic() * 1000 - event.time
+        if self._key_offset is None or offset < self._key_offset:
+            self._key_offset = offset
+        self.key_lags.append(offset - self._key_offset)
+        if len(self.key_lags) >= KEY_REPORT_EVERY:
+            lags, self.key_lags = sorted(self.key_lags), []
+            self._write(
+                f"=== Input latency at {datetime.now().isoformat()} ({self.label or 'default'}) "
+                f"over {len(lags)} keys: p50 {lags[len(lags) // 2]:.0f} ms, "
+                f"p95 {lags[len(lags) * 95 // 100]:.0f} ms, max {lags[-1]:.0f} ms ==="
+            )
+
+    def _lag(self, beat):
+        return time.monotonic() - beat - self.interval
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval / 2):
+            # Read the beat once so the check and the capture agree on it
+            beat = self.last_beat
+            if self._lag(beat) > self.threshold:
+                self._capture_stall(beat)
+
+    def _capture_stall(self, started):
+        """Sample the main thread until the heartbeat after `started` arrives, then write one report"""
+        stacks = Counter()
+        samples = 0
+        while self.last_beat == started and not self._stop.is_set():
+            frame = sys._current_frames().get(self.main_thread_id)
+            if frame is not None and samples < self.max_samples:
+                stacks["".join(traceback.format_stack(frame))] += 1
+                samples += 1
+            del frame
+            time.sleep(self.interval / 2)
+        lag = self.last_beat - started - self.interval
+        if lag < self.threshold:
+            return  # The beat was only late by timer jitter, or we are stopping
+        self.stall_count += 1
+        self.worst_lag = max(self.worst_lag, lag)
+        self._write_report(lag, stacks)
+
+    def _write_report(self, lag, stacks):
+        lines = [
+            f"=== Stall #{self.stall_count} at {datetime.now().isoformat()} "
+            f"— event loop blocked for {lag * 1000:.0f} ms ==="
+        ]
+        for stack, hits in stacks.most_common():
+            lines.append(f"--- {hits} sample(s) ---")
+            lines.append(stack.rstrip())
+        if self.trace_memory and tracemalloc.is_tracing():
+            lines.append("--- Top allocations ---")
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]:
+                lines.append(str(stat))
+        self._write("\n".join(lines))
+
+    def _write(self, text):
+        directory = os.path.dirname(self.log_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.log_path, "a") as f:
+            f.write(text + "\n\n")
@@ -0,0 +1,142 @@
+import json
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+from backends import BackendPool
+from engine import ChatEngine
+from resilience import CircuitOpenError, ModelUnavailableError
+from test_resilience import StallingHandler
+
+
+class OllamaHandler(StallingHandler):
+    """/api/tags, /api/ps and a one-line /api/chat stream; may die mid-reply"""
+
+    models = ()
+    loaded = ()
+    reply = "ok"
+    die_mid_reply = False
+
+    def _json(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, body):
+        data = (json.dumps(body) + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        names = self.models if self.path == "/api/tags" else self.loaded
+        self._json({"models": [{"name": name} for name in names]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk({"message": {"role": "assistant", "content": self.reply}})
+        if self.die_mid_reply:
+            # The host goes away: stop listening and cut the stream short
+            self.server.shutdown()
+            self.server.server_close()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self._chunk({"message": {"role": "assistant", "content": ""}, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def hosts():
+    servers = []
+
+    def start(**attrs):
+        handler = type("Handler", (OllamaHandler,), attrs)
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_list_models_merges_hosts(hosts):
+    pool = BackendPool([hosts(models=["a", "b"]), hosts(models=["b", "c"]), hosts(models=[])])
+    pool.check_all()
+    assert pool.list_models() == ["a", "b", "c"]
+
+
+def test_routing_prefers_loaded_model_then_least_loaded(hosts):
+    first = hosts(models=["m", "n"])
+    second = hosts(models=["m", "n"], loaded=["m"])
+    third = hosts(models=["x"])
+    pool = BackendPool([first, second, third])
+    pool.check_all()
+    assert pool.acquire("m").url == second
+    assert pool.acquire("m").url == second  # Still wins while it has the model loaded
+    assert pool.acquire("n").url == first
+    assert pool.acquire("n").url == first
+    pool.release(pool.backends[1])
+    assert pool.acquire("n").url == second  # Now the least loaded
+    assert pool.acquire("x").url == third
+    assert pool.acquire("missing") is None
+
+
+def test_failover_when_host_dies_mid_reply(hosts):
+    dying = hosts(models=["m"], reply="partial", die_mid_reply=True)
+    survivor = hosts(models=["m"], reply="full answer")
+    pool = BackendPool([dying, survivor])
+    pool.check_all()
+    pieces = []
+    answer, _, _ = ChatEngine(pool)._stream_payload(
+        "m", {"model": "m", "messages": [], "stream": True},
+        on_piece=lambda channel, text: pieces.append((channel, text)), prefer=dying
+    )
+    assert answer == "full answer"
+    assert ("restart", "") in pieces
+    counts, _ = pool.events.snapshot()
+    assert counts.get("connection_error") == 1
+    assert not pool.backends[0].healthy
+    assert all(b.in_flight == 0 for b in pool.backends)
+    assert not pool.check(pool.backends[0])  # The host stays unreachable
+
+
+def test_missing_model_is_not_counted_as_shed(hosts):
+    pool = BackendPool([hosts(models=["m"])])
+    pool.check_all()
+    with pytest.raises(ModelUnavailableError):
+        pool.request("missing", lambda url: None)
+    pool.backends[0].breaker.record_failure()
+    pool.mark_down(pool.backends[0])
+    with pytest.raises(CircuitOpenError):
+        pool.request("m", lambda url: None)
+    counts, _ = pool.events.snapshot()
+    assert counts == {"no_host_for_model": 1, "shed": 1}
+
+
+def _stall_before_headers(handler):
+    time.sleep(2.0)
+
+
+@pytest.mark.parametrize("stall", [_stall_before_headers, StallingHandler.do_GET],
+                         ids=["headers", "body"])
+def test_read_timeout_is_recorded(hosts, stall):
+    pool = BackendPool([hosts(do_GET=stall, first_line=False, pause=2.0)])
+    with pytest.raises(requests.RequestException):
+        pool.request("m", lambda base_url: requests.get(base_url, timeout=(2.0, 0.5)).content)
+    counts, _ = pool.events.snapshot()
+    assert counts == {"read_timeout": 1}
+    assert pool.backends[0].healthy  # Slow, not down
@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+from jsonstream import DONE, FIELD, ITEM, IncrementalJSONParser, JSONStreamError
+
+VALID = [
+    '{"a": 1, "b": [2, 3, {"c": "d\\"e"}], "f": {}, "g": [], "h": null}',
+    '[1, -2.5e3, true, false, "x", [[]], {"k": [1]}]',
+    '  "just a string"  ',
+    '{"nested": {"deep": {"deeper": [1, 2, 3]}}}',
+]
+
+MALFORMED = [
+    '{"a" 1}',      # Missing colon
+    '{1}',          # Non-string key
+    '[1 2]',        # Missing comma
+    '{"a": 1 "b": 2}',
+    '{"a": 1,}',    # Trailing comma
+    '[1,]',
+    '[,1]',
+    '{,"a": 1}',
+    '{"a":: 1}',
+    '{"a": 1:}',
+    '["a": 1]',
+    '{"a"}',
+    '{"a": }',
+    '[1}',
+    '{"a": 1]',
+    '"a" "b"',
+]
+
+
+def parse(text, chunk=None):
+    parser = IncrementalJSONParser()
+    events = []
+    step = chunk or len(text)
+    for i in range(0, len(text), step):
+        events.extend(parser.feed(text[i:i + step]))
+    events.extend(parser.finish())
+    return parser, events
+
+
+@pytest.mark.parametrize("text", VALID)
+def test_matches_json_loads_in_any_chunking(text):
+    for chunk in (None, 1, 3, 7):
+        parser, events = parse(text, chunk)
+        assert parser.done
+        assert events[-1] == (DONE, (), json.loads(text))
+
+
+@pytest.mark.parametrize("text", MALFORMED)
+def test_rejects_malformed_json(text):
+    with pytest.raises(JSONStreamError):
+        parse(text)
+    with pytest.raises(JSONStreamError):
+        parse(text, chunk=1)
+
+
+def test_events_report_paths_as_members_close():
+    _, events = parse('{"a": [1, {"b": 2}]}', chunk=1)
+    assert events[:4] == [
+        (ITEM, ("a", 0), 1),
+        (FIELD, ("a", 1, "b"), 2),
+        (ITEM, ("a", 1), {"b": 2}),
+        (FIELD, ("a",), [1, {"b": 2}]),
+    ]
+
+
+def test_random_splits_give_the_same_events():
+    text = VALID[0]
+    expected = parse(text)[1]
+    rng = random.Random(1)
+    for _ in range(100):
+        parser = IncrementalJSONParser()
+        events, pos = [], 0
+        while pos < len(text):
+            step = rng.randint(1, 6)
+            events.extend(parser.feed(text[pos:pos + step]))
+            pos += step
+        assert events == expected
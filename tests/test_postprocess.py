@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from postprocess import ResponsePostProcessor
+
+SAMPLES = [
+    "foo</think>bar<think>baz</think>qux",
+    "<think>plan the answer</think>\n\nThe answer is 42.",
+    "reasoning from a template</think>Answer with <b>html</b> and </thi",
+    "a<think>b</think>c<think>d</think>e</think>f",
+    "<<think>></think></think><think",
+    "no tags at all, just text",
+]
+
+
+def process(chunks):
+    processor = ResponsePostProcessor()
+    for chunk in chunks:
+        processor.feed(chunk)
+    return processor.finish()
+
+
+def random_split(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(0, len(text) - 1)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_result_does_not_depend_on_chunk_boundaries(text):
+    rng = random.Random(text)
+    expected = process([text])
+    for _ in range(200):
+        assert process(random_split(text, rng)) == expected
+
+
+def test_stray_close_tag_reclassifies_only_what_precedes_it():
+    assert process(["foo</think>bar<think>baz</think>qux"]) == ("barqux", "foo\n\nbaz")
+
+
+def test_close_tag_after_a_block_is_literal_text():
+    reply = "<think>plan</think>To end reasoning, R1 emits the </think> tag after it."
+    assert process([reply]) == ("To end reasoning, R1 emits the </think> tag after it.", "plan")
+
+
+def test_reasoning_blocks_are_kept_apart():
+    assert process(["<think>a</think>x<think>b</think>y"]) == ("xy", "a\n\nb")
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from resilience import EventLog, StreamTimeout, TimeoutPolicy, iter_stream_lines
+
+
+class StallingHandler(BaseHTTPRequestHandler):
+    """Chunked NDJSON: optionally one line, then silence for `pause` seconds"""
+
+    protocol_version = "HTTP/1.1"
+    pause = 5.0
+    first_line = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.first_line:
+            data = (json.dumps({"message": {"content": "hi"}}) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        time.sleep(self.pause)
+        try:
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StallingHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+
+
+def read_all(url, policy, events):
+    with requests.get(url, stream=True, timeout=policy.requests_timeout()) as response:
+        return list(iter_stream_lines(response, policy, events, url))
+
+
+def test_stall_deadline_fires_on_time(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    policy = TimeoutPolicy(connect=2.0, first_byte=30.0, stall=1.0)
+    events = EventLog()
+    started = time.monotonic()
+    with pytest.raises(StreamTimeout) as info:
+        read_all(url, policy, events)
+    elapsed = time.monotonic() - started
+    assert info.value.kind == "stall"
+    assert elapsed < 2.0
+    assert events.snapshot()[0] == {"stall_timeout": 1}
+
+
+def test_first_byte_deadline_fires_on_time(server, monkeypatch):
+    monkeypatch.setattr(StallingHandler, "first_line", False)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    policy = TimeoutPolicy(connect=2.0, first_byte=1.0, stall=30.0)
+    started = time.monotonic()
+    with pytest.raises(StreamTimeout) as info:
+        read_all(url, policy, EventLog())
+    assert info.value.kind == "first_byte"
+    assert time.monotonic() - started < 2.0
@@ -0,0 +1,22 @@
+import time
+
+from worker import FLUSH_INTERVAL, _Batcher
+
+
+def test_batcher_flushes_first_piece_and_then_on_a_timer():
+    sent = []
+    batcher = _Batcher(lambda message: sent.append((time.monotonic(), message)), job=7)
+    started = time.monotonic()
+    batcher.piece("answer", "a")
+    assert [m[2] for _, m in sent] == [[("answer", "a")]]
+
+    # Pieces arriving before a pause must go out without waiting for the next one
+    batcher.piece("answer", "b")
+    batcher.piece("answer", "c")
+    time.sleep(FLUSH_INTERVAL * 5)
+    assert [m[2] for _, m in sent] == [[("answer", "a")], [("answer", "bc")]]
+    assert sent[1][0] - started < FLUSH_INTERVAL * 4
+
+    batcher.piece("reasoning", "d")
+    batcher.close()
+    assert sent[-1][1] == ("batch", 7, [("reasoning", "d")], [])
@@ -0,0 +1,109 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_CAPACITY = 20000  # Spans kept in memory; the oldest are dropped first
+
+
+class Tracer:
+    """Span recorder for following one request across threads and processes.
+
+    Spans are (trace id, name, start ns, end ns, pid, track, args) tuples in
+    a bounded ring, so tracing can stay on all the time. A thread binds the
+    trace it is working for with bind(); spans opened on that thread without
+    an explicit trace id join it. Times come from perf_counter_ns, which is
+    the system-wide monotonic clock on Linux and macOS, so spans recorded in
+    the worker process line up with the GUI's. export() writes the Chrome
+    trace event format, readable by chrome://tracing and ui.perfetto.dev.
+    """
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.spans = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self.pid = os.getpid()
+
+    def new_trace(self):
+        return next(self._ids)
+
+    def current(self):
+        return getattr(self._local, "trace_id", None)
+
+    @contextmanager
+    def bind(self, trace_id):
+        """Make trace_id the default for spans recorded on this thread"""
+        previous = self.current()
+        self._local.trace_id = trace_id
+        try:
+            yield
+        finally:
+            self._local.trace_id = previous
+
+    @contextmanager
+    def span(self, name, trace_id=None, **args):
+        """Time a block; the yielded dict can be filled with extra args"""
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            self.record(name, start, time.perf_counter_ns(), trace_id, **args)
+
+    def record(self, name, start_ns, end_ns, trace_id=None, track=None, **args):
+        """Add a finished span; track defaults to the current thread's name"""
+        trace_id = trace_id if trace_id is not None else self.current()
+        if trace_id is None:
+            return
+        span = (trace_id, name, start_ns, end_ns, self.pid,
+                track or threading.current_thread().name, args)
+        with self.lock:
+            self.spans.append(span)
+
+    def spans_for(self, trace_id):
+        with self.lock:
+            return [s for s in self.spans if s[0] == trace_id]
+
+    def take(self, trace_id):
+        """Remove and return a trace's spans, e.g. to send them to another process"""
+        with self.lock:
+            taken = [s for s in self.spans if s[0] == trace_id]
+            if taken:
+                kept = [s for s in self.spans if s[0] != trace_id]
+                self.spans.clear()
+                self.spans.extend(kept)
+            return taken
+
+    def extend(self, spans):
+        """Merge spans recorded by another process"""
+        with self.lock:
+            self.spans.extend(spans)
+
+    def export(self, path, trace_id=None):
+        """Write the spans of one trace (default: all) as Chrome trace JSON"""
+        if trace_id is not None:
+            spans = self.spans_for(trace_id)
+        else:
+            with self.lock:
+                spans = list(self.spans)
+        tracks = {}
+        events = []
+        for tid, name, start, end, pid, track, args in spans:
+            if (pid, track) not in tracks:
+                tracks[(pid, track)] = len(tracks) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                               "tid": tracks[(pid, track)], "args": {"name": track}})
+            events.append({
+                "name": name, "ph": "X", "pid": pid, "tid": tracks[(pid, track)],
+                "ts": start / 1000, "dur": (end - start) / 1000,
+                "args": dict(args, trace=tid)
+            })
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events) - len(tracks)
@@ -0,0 +1,189 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+
+from engine import ChatEngine
+
+FLUSH_INTERVAL = 0.03  # Seconds between the worker's batched sends to the GUI
+
+
+class WorkerError(RuntimeError):
+    """An exception raised inside the worker process, carried across as text"""
+
+
+class ProcessEngine(ChatEngine):
+    """ChatEngine whose Ollama streams and attachment encoding run in a child process.
+
+    The GUI process keeps its own pool for light calls (health checks,
+    model lists, warm-ups, embeddings). Streaming replies and base64
+    encoding happen in the worker, which owns a second pool and sends back
+    only batched (channel, text) pieces, JSON events and the final result.
+    Reading NDJSON, parsing and post-processing therefore never hold the
+    GUI's GIL. Several streams can run at once; each is tagged with a job id.
+    Spans the worker records for the caller's trace are merged into this
+    engine's tracer when the job finishes.
+    """
+
+    def __init__(self, pool=None):
+        super().__init__(pool)
+        context = multiprocessing.get_context("spawn")  # Never fork a process running Tk
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._ids = itertools.count()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                inbox = self._jobs.get(message[1])
+            if inbox is not None:
+                inbox.put(message)
+        with self._lock:
+            jobs, self._jobs = self._jobs, {}
+        for inbox in jobs.values():
+            inbox.put(("error", None, "Worker process exited", []))
+
+    def _call(self, request, on_piece=None, on_event=None):
+        """Send one job and block this thread until its result arrives"""
+        job = next(self._ids)
+        inbox = queue.Queue()
+        with self._lock:
+            if not self.process.is_alive():
+                raise WorkerError("Worker process exited")
+            self._jobs[job] = inbox
+            self._conn.send((request[0], job, self.tracer.current()) + request[1:])
+        try:
+            while True:
+                kind, _, *data = inbox.get()
+                if kind in ("result", "error"):
+                    self.tracer.extend(data[1])
+                if kind == "batch":
+                    pieces, events = data
+                    for channel, text in pieces:
+                        if on_piece:
+                            on_piece(channel, text)
+                    for event in events:
+                        if on_event:
+                            on_event(*event)
+                elif kind == "result":
+                    return data[0]
+                else:
+                    raise WorkerError(data[0])
+        finally:
+            with self._lock:
+                self._jobs.pop(job, None)
+
+    def encode_attachments(self, attachments):
+        return self._call(("encode", attachments))
+
+    def _stream_payload(self, model, payload, on_piece=None, schema=None, on_event=None, prefer=None):
+        return self._call(("stream", model, payload, schema, prefer), on_piece, on_event)
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=2)
+
+
+class _Batcher:
+    """Coalesces a job's pieces and events and sends them every FLUSH_INTERVAL.
+
+    The first piece goes out at once so time to first token is not delayed;
+    after that a flush thread sends whatever has accumulated on each tick,
+    so text never waits for the next token to arrive.
+    """
+
+    def __init__(self, send, job):
+        self.send = send
+        self.job = job
+        self.pieces = []
+        self.events = []
+        self.sent_any = False
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def piece(self, channel, text):
+        with self.lock:
+            if self.pieces and self.pieces[-1][0] == channel and channel != "restart":
+                self.pieces[-1] = (channel, self.pieces[-1][1] + text)
+            else:
+                self.pieces.append((channel, text))
+            first = not self.sent_any
+        if first:
+            self.flush()
+
+    def event(self, kind, path, value):
+        with self.lock:
+            self.events.append((kind, path, value))
+
+    def _flush_loop(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not (self.pieces or self.events):
+                return
+            batch = ("batch", self.job, self.pieces, self.events)
+            self.pieces, self.events = [], []
+            self.sent_any = True
+            # Send under the lock so batches leave in order
+            self.send(batch)
+
+    def close(self):
+        """Stop the flush thread and send anything still buffered"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
+def _worker_main(conn):
+    """Entry point of the worker process: serve jobs until the pipe closes"""
+    engine = ChatEngine()
+    engine.pool.check_all()
+    engine.pool.start()
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def run(kind, job, trace_id, *args):
+        batcher = _Batcher(send, job)
+        try:
+            with engine.tracer.bind(trace_id):
+                if kind == "encode":
+                    result = engine.encode_attachments(*args)
+                else:
+                    model, payload, schema, prefer = args
+                    result = engine._stream_payload(model, payload, batcher.piece, schema,
+                                                    batcher.event, prefer)
+            batcher.close()
+            send(("result", job, result, engine.tracer.take(trace_id)))
+        except Exception as e:
+            batcher.close()
+            send(("error", job, f"{type(e).__name__}: {e}", engine.tracer.take(trace_id)))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        threading.Thread(target=run, args=request, daemon=True).start()
+    engine.pool.stop()